@@ -1,2 +1,3 @@
 from .aceclient import *
 from .acemessages import *
+from .backend import *
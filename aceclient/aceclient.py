@@ -2,15 +2,22 @@
 __author__ = 'ValdikSS, AndreyPavlenko, Dorik1972'
 
 import gevent
-import telnetlib
 import logging
+import time
+from itertools import count
+from collections import defaultdict, deque
 from gevent.event import AsyncResult
+from gevent.lock import Semaphore
+from gevent import socket
 from gevent.util import wrap_errors
 from requests.compat import json
 from urllib3.packages.six.moves.urllib.parse import unquote
 from urllib3.packages.six.moves import zip
-from urllib3.packages.six import PY2
+from urllib3.packages.six import ensure_binary, ensure_str
 from .acemessages import *
+from .backend import EngineBackend
+
+logger = logging.getLogger('AceClient')
 
 class AceException(Exception):
     '''
@@ -18,22 +25,10 @@ class AceException(Exception):
     '''
     pass
 
-class Telnet(telnetlib.Telnet, object):
+class AceClient(EngineBackend):
     '''
-    Patching telnetlib methods for Py3 backward compatibility
+    AceEngine API port client
     '''
-    if not PY2:
-       def read_until(self, expected, timeout=None):
-           return super(Telnet, self).read_until(bytes(expected, 'ascii'), timeout).decode()
-
-       def write(self, buffer):
-           super(Telnet, self).write(bytes(buffer, 'ascii'))
-
-       def expect(self, list, timeout=None):
-           match_index, match_object, match_text = super(Telnet, self).expect([bytes(item, 'ascii') for item in list], timeout)
-           return match_index, match_object, match_text.decode()
-
-class AceClient(object):
 
     def __init__(self, params):
 
@@ -48,21 +43,30 @@ class AceClient(object):
         self._videotimeout = params.get('videotimeout', 30)
         # AceEngine API maximum allowable response read delay
         self._responsetimeout = params.get('result_timeout', 5)
-        # AceEngine API responses (Created with AsyncResult() on call)
-        self._response = {}.fromkeys(['HELLOTS','AUTH','NOTREADY','LOADRESP','START','STATE','STATUS','EVENT',
-                                      'STOP','PAUSE','RESUME','INFO','SHUTDOWN',], AsyncResult())
+        # AceEngine API responses without request id: {'name': FIFO of AsyncResult() waiters}
+        self._response = defaultdict(deque)
+        # LOADRESP responses correlated by request id: {'request_id': AsyncResult()}
+        self._loadresp = {}
+        self._requestid = count(1)
+        self._writelock = Semaphore()
+        # The latest STATUS and EVENT livepos of the current broadcast with their arrival time
+        self._status = self._livepos = None
         # Broadcast title
         self._title = 'idleAce'
+        # Idle session in a session pool: read timeout doesn't close it while it waits for a broadcast
+        self.pooled = False
         # AceEngine socket
         try:
-           self._socket = Telnet(params.get('ace')['aceHostIP'], params.get('ace')['aceAPIport'], params.get('connect_timeout', 10))
+           self._socket = socket.create_connection((params.get('ace')['aceHostIP'], int(params.get('ace')['aceAPIport'])),
+                                                   params.get('connect_timeout', 10))
         except:
            raise AceException('The are no alive AceStream Engines found!')
         else:
-           # Spawning telnet data reader with recvbuffer read timeout (allowable STATE 0 (IDLE) time)
-           self._read = gevent.spawn(self._read, self._videotimeout)
+           # Spawning API connection reader with read timeout (allowable STATE 0 (IDLE) time)
+           self._read = gevent.spawn(self._read, params.get('idletimeout', self._videotimeout))
            self._read.link(lambda x: self._socket.close())
-           self._read.link(lambda x: logging.debug('[%.20s]: >>> %s' % (self._title, 'CLOSE telnet connetcion')))
+           self._read.link(lambda x: self._abort())
+           self._read.link(lambda x: logger.debug('[%.20s]: >>> CLOSE API connection', self._title))
 
     def __bool__(self):
         return self._read.started
@@ -75,55 +79,120 @@ class AceClient(object):
         AUTH method
         '''
         try:
-           self._response['HELLOTS'] = AsyncResult()
-           self._write(AceRequest.HELLOBG())
-           paramsdict = self._response['HELLOTS'].get(timeout=self._responsetimeout)
+           paramsdict = self._request(AceRequest.HELLOBG(), 'HELLOTS', self._responsetimeout)
         except gevent.Timeout as t:
            raise AceException('Engine response time %s exceeded. HELLOTS not resived!' % t)
+        notready = self._expect('NOTREADY')
         try:
-           self._response['AUTH'] = AsyncResult()
-           self._response['NOTREADY'] = AsyncResult()
-           self._write(AceRequest.READY(paramsdict.get('key'), self._product_key))
-           auth_level = self._response['AUTH'].get(timeout=self._responsetimeout)
+           auth_level = self._request(AceRequest.READY(paramsdict.get('key'), self._product_key), 'AUTH', self._responsetimeout)
            if int(paramsdict.get('version_code', 0)) >= 3003600:
               self._write(AceRequest.SETOPTIONS({'use_stop_notifications': '1'}))
         except gevent.Timeout as t:
-           if self._response['NOTREADY'].value:
-              errmsg = 'Engine response time %s exceeded. %s resived!' % (t, self._response['NOTREADY'].value)
+           if notready.value:
+              errmsg = 'Engine response time %s exceeded. %s resived!' % (t, notready.value)
            else:
               errmsg = 'Engine response time %s exceeded. AUTH not resived!' % t
            raise AceException(errmsg)
+        finally:
+           self._forget('NOTREADY', notready)
 
     def _read(self, timeout=30):
         '''
-        Read telnet connection method
+        Read API connection method.
+        Received data is split into lines in one buffer, every line is dispatched right here
+        timeout: idle read timeout (None - connection is never closed by timeout)
         '''
+        pending = b''
+        self._socket.settimeout(timeout)
         while 1:
-           with gevent.Timeout(timeout, False):
-              try:
-                 recvbuffer = self._socket.read_until('\r\n', None).strip().split()
-                 logging.debug('[%.20s]: <<< %s' % (self._title, unquote(' '.join(recvbuffer))))
-                 gevent.spawn(getattr(globals()[self.__class__.__name__], '_%s_' % recvbuffer[0].lower(), '_unrecognized_'), self, recvbuffer).link_value(self._response[recvbuffer[0]])
-              except gevent.socket.timeout: pass # WinOS patch
-              except gevent.Timeout:
-                 self.ShutdownAce()
-                 break
-              except: break # Telnet connection unexpectedly closed or telnet connection error
+           try: data = self._socket.recv(65536)
+           except socket.timeout:
+              if self.pooled: continue
+              try: self.ShutdownAce()
+              except AceException: pass
+              break
+           except: break # API connection error
+           if not data: break # API connection unexpectedly closed
+           lines = (pending + data).split(b'\r\n')
+           pending = lines.pop()
+           for line in lines:
+              recvbuffer = ensure_str(line, errors='replace').split()
+              if not recvbuffer: continue
+              if logger.isEnabledFor(logging.DEBUG):
+                 logger.debug('[%.20s]: <<< %s', self._title, unquote(' '.join(recvbuffer)))
+              try: self._dispatch(recvbuffer)
+              except Exception as e:
+                 logger.warning('[%.20s]: error parsing API response %s: %r', self._title, recvbuffer[0], e)
+              if recvbuffer[0] == 'SHUTDOWN': return
+
+
+    def _dispatch(self, recvbuffer):
+        '''
+        Parse AceEngine API response and pass it to the waiting request.
+        LOADRESP goes to the request with the same request id, notifications (STATUS, EVENT, STATE)
+        wake up all their waiters, any other response goes to the oldest waiter for it
+        '''
+        name = recvbuffer[0]
+        value = self._handlers.get(name, AceClient._unrecognized_)(self, recvbuffer)
+        if name == 'LOADRESP':
+           result = self._loadresp.pop(recvbuffer[1], None)
+           if result: result.set(value)
+        elif name in ('STATUS', 'EVENT', 'STATE'):
+           waiters, self._response[name] = self._response[name], deque()
+           for result in waiters: result.set(value)
+        elif self._response[name]:
+           self._response[name].popleft().set(value)
+
+    def _expect(self, name):
+        '''
+        Register waiter for the next AceEngine API response without request id
+        '''
+        result = AsyncResult()
+        self._response[name].append(result)
+        return result
+
+    def _forget(self, name, result):
+        '''
+        Remove waiter which did not get its response
+        '''
+        try: self._response[name].remove(result)
+        except ValueError: pass
+
+    def _request(self, message, name, timeout):
+        '''
+        Send command (if any) and wait for its response without request id.
+        Concurrent commands with the same response name get responses in the order they were sent
+        '''
+        result = self._expect(name)
+        try:
+           if message: self._write(message)
+           return result.get(timeout=timeout)
+        finally:
+           self._forget(name, result)
 
+    def _abort(self):
+        '''
+        Connection closed - fail all the pending requests at once
+        '''
+        error = AceException('AceEngine API connection closed')
+        waiters = list(self._loadresp.values()) + [x for name in list(self._response) for x in self._response[name]]
+        self._loadresp.clear(); self._response.clear()
+        for result in waiters: result.set_exception(error)
 
     def _write(self, message):
         '''
-        Write telnet connection method
+        Write API connection method
         '''
         try:
-           self._socket.write('%s\r\n' % message)
-           logging.debug('[%.20s]: >>> %s' % (self._title, message))
+           with self._writelock:
+              self._socket.sendall(ensure_binary('%s\r\n' % message))
+           logger.debug('[%.20s]: >>> %s', self._title, message)
         except gevent.socket.error:
            raise AceException('Error writing data to AceEngine API port')
 
     def ShutdownAce(self):
         '''
-        Shutdown telnet connection method
+        Shutdown API connection method
         '''
         self._write(AceRequest.SHUTDOWN)
 
@@ -138,20 +207,15 @@ class AceClient(object):
         AceEngine sends us STOP and START again with new link. We use only second link then.
         '''
         try:
-           self._response['START'] = AsyncResult()
-           self._write(AceRequest.START(paramsdict))
-           paramsdict = self._response['START'].get(timeout=self._videotimeout)
+           paramsdict = self._request(AceRequest.START(paramsdict), 'START', self._videotimeout)
            if self._seekback and paramsdict.get('stream') and not paramsdict['url'].endswith('.m3u8'):
               try:
-                 self._response['EVENT'] = AsyncResult()
-                 paramsdict = self._response['EVENT'].get(timeout=self._responsetimeout)
+                 paramsdict = self._request(None, 'EVENT', self._responsetimeout)
               except gevent.Timeout as t:
                  raise AceException('EVENT livepos not received! Engine response time %s exceeded' % t)
               else:
                  try:
-                    self._response['START'] = AsyncResult()
-                    self._write(AceRequest.LIVESEEK(int(paramsdict['last']) - self._seekback))
-                    paramsdict = self._response['START'].get(timeout=self._videotimeout)
+                    paramsdict = self._request(AceRequest.LIVESEEK(int(paramsdict['last']) - self._seekback), 'START', self._videotimeout)
                  except gevent.Timeout as t:
                     raise AceException('START URL not received after LIVESEEK! Engine response time %s exceeded' % t)
            return paramsdict
@@ -162,21 +226,34 @@ class AceClient(object):
         '''
         Stop video method
         '''
+        self._status = self._livepos = None
         self._write(AceRequest.STOP)
 
     def GetLOADASYNC(self, paramsdict):
+        '''
+        LOADASYNC with unique request id on this connection, so many lookups can be in flight at once
+        '''
+        requestid = str(next(self._requestid))
+        result = self._loadresp[requestid] = AsyncResult()
         try:
-           self._response['LOADRESP'] = AsyncResult()
-           self._write(AceRequest.LOADASYNC(paramsdict))
-           return self._response['LOADRESP'].get(timeout=self._responsetimeout) # Get _contentinfo json
+           self._write(AceRequest.LOADASYNC(dict(paramsdict, sessionID=requestid)))
+           return result.get(timeout=self._responsetimeout) # Get _contentinfo json
         except gevent.Timeout as t:
            raise AceException('Engine response %s time exceeded. LOADRESP not resived!' % t)
+        finally:
+           self._loadresp.pop(requestid, None)
 
     def GetSTATUS(self):
-        try:
-           self._response['STATUS'] = AsyncResult()
-           return self._response['STATUS'].get(timeout=self._responsetimeout) # Get status
-        except: return {'status': 'error'}
+        '''
+        The latest STATUS snapshot ('updated' - its arrival time). Does not wait for the engine
+        '''
+        return dict(self._status) if self._status else {'status': 'error'}
+
+    def GetLIVEPOS(self):
+        '''
+        The latest EVENT livepos snapshot ('updated' - its arrival time) or None
+        '''
+        return dict(self._livepos) if self._livepos else None
 
     def GetCONTENTINFO(self, paramsdict):
         paramsdict = self.GetLOADASYNC(paramsdict)
@@ -234,7 +311,9 @@ class AceClient(object):
         recvbuffer = recvbuffer[1].split(';')
         if any(x in ['main:wait', 'main:seekprebuf'] for x in recvbuffer): del recvbuffer[1] #wait;time; / main:seekprebuf;progress
         elif any(x in ['main:buf','main:prebuf'] for x in recvbuffer): del recvbuffer[1:3] #buf/prebuf;progress;time;
-        return {k:v.split(':')[1] if 'main' in v else v for k,v in zip(AceConst.STATUS, recvbuffer)}
+        self._status = {k:v.split(':')[1] if 'main' in v else v for k,v in zip(AceConst.STATUS, recvbuffer)}
+        self._status['updated'] = time.time()
+        return self._status
 
     def _event_(self, recvbuffer):
         '''
@@ -246,7 +325,9 @@ class AceClient(object):
         '''
         if 'getuserdata' in recvbuffer: self._write(AceRequest.USERDATA({'gender': self._gender, 'age': self._age}))
         elif any(x in ['cansave', 'showurl', 'download_stopped'] for x in recvbuffer): pass
-        return {k:v for k,v in [x.split('=') for x in recvbuffer[2:] if '=' in x]}
+        paramsdict = {k:v for k,v in [x.split('=') for x in recvbuffer[2:] if '=' in x]}
+        if 'livepos' in recvbuffer: self._livepos = dict(paramsdict, updated=time.time())
+        return paramsdict
 
     def _stop_(self, recvbuffer):
         '''
@@ -270,11 +351,15 @@ class AceClient(object):
         pass
     def _shutdown_(self, recvbuffer):
         '''
-        SHUTDOWN
+        SHUTDOWN (reader stops after it)
         '''
-        self._read.kill()
+        pass
     def _unrecognized_(self, recvbuffer):
-        logging.warning('[%.20s]: unintended API response <<< %s' % (self._title, ' '.join(recvbuffer)))
+        logger.warning('[%.20s]: unintended API response <<< %s', self._title, ' '.join(recvbuffer))
 
 
 ######################################## END AceEngine API answers parsers ########################################
+
+# AceEngine API answers parsers by answer name: {'LOADRESP': AceClient._loadresp_, ...}
+AceClient._handlers = {k[1:-1].upper(): v for k, v in vars(AceClient).items()
+                       if k.startswith('_') and k.endswith('_') and not k.startswith('__') and k != '_unrecognized_'}
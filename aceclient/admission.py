@@ -0,0 +1,82 @@
+'''
+Admission control for BroadcastStreamer
+Requests over the client or channel limits wait in a bounded queue for a free slot instead of an instant error
+'''
+__author__ = 'Dorik1972'
+
+import time
+import logging
+from heapq import heappush, heapify
+from itertools import count
+from gevent.event import Event
+
+logger = logging.getLogger('Admission')
+
+class AdmissionController(object):
+    '''
+    Bounded priority queue of requests waiting for a free slot.
+    Waiters are served by priority (pinned channel, running broadcast, new broadcast),
+    then clients with fewer streams first, then in arrival order.
+    queuesize: maximum number of waiting requests, perip: maximum number of waiting requests from one client IP,
+    wait: seconds a request waits for a slot (0 - rejected at once)
+    '''
+    PINNED, RUNNING, NEW = range(3)
+
+    def __init__(self, queuesize=20, perip=2, wait=10):
+        self.queuesize, self.perip, self.wait = queuesize, perip, wait
+        self.waiting = []  # Heap of [(priority, share, arrival), 'clientip', Event]
+        self.pending = [0, 0]  # Admitted requests not attached to a broadcast yet: [clients, new broadcasts]
+        self._arrival = count()
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def admit(self, clientip, priority, share, available):
+        '''
+        Wait for a free slot.
+        priority: PINNED, RUNNING or NEW (request starts a new broadcast)
+        share: number of streams the client IP already has
+        available(clients, broadcasts): True if there is a free slot besides the ones taken by the admitted requests
+        :return ticket to pass to done() or None if the queue is full or no slot became free in time
+        '''
+        ticket = [1, int(priority == self.NEW)]
+        if not self.waiting and available(*self.pending): return self._take(ticket)
+        if len(self.waiting) >= self.queuesize or sum(1 for x in self.waiting if x[1] == clientip) >= self.perip:
+           logger.debug('[%s]: Admission queue is full (%d waiting)', clientip, len(self.waiting))
+           return None
+        entry = [(priority, share, next(self._arrival)), clientip, Event()]
+        heappush(self.waiting, entry)
+        logger.debug('[%s]: Waiting for a free slot (%d in queue)', clientip, len(self.waiting))
+        deadline = time.time() + self.wait
+        try:
+           while 1:
+              if self.waiting[0] is entry and available(*self.pending): return self._take(ticket)
+              remaining = deadline - time.time()
+              if remaining <= 0: return None
+              entry[2].clear()
+              entry[2].wait(min(remaining, 1.0))  # Slots are also freed without notify (e.g. linger timeout)
+        finally:
+           self.waiting.remove(entry)
+           heapify(self.waiting)
+           self.notify()
+
+    def done(self, ticket):
+        '''
+        Admitted request is attached to its broadcast (or failed) - its slot is counted by the broadcast manager now
+        '''
+        if ticket:
+           self.pending[0] -= ticket[0]
+           self.pending[1] -= ticket[1]
+           ticket[:] = [0, 0]
+           self.notify()
+
+    def notify(self):
+        '''
+        Slot may be free: wake up the first waiting request
+        '''
+        if self.waiting: self.waiting[0][2].set()
+
+    def _take(self, ticket):
+        self.pending[0] += ticket[0]
+        self.pending[1] += ticket[1]
+        return ticket
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+'''
+AceEngine backend interface for BroadcastStreamer
+'''
+
+from abc import ABCMeta, abstractmethod
+from urllib3.packages.six import with_metaclass
+
+BACKENDS = ('telnet', 'http')
+
+class EngineBackend(with_metaclass(ABCMeta, object)):
+    '''
+    AceEngine client interface used by Broadcast, BroadcastManager and SessionPool.
+    Backend missing any of the methods can't be instantiated.
+    Implementations:
+      AceClient     - engine API port (LOADASYNC/START over HELLOBG/READY/AUTH session)
+      AceHTTPClient - engine HTTP API (/ace/getstream, /ace/manifest.m3u8 on aceHTTPport)
+    '''
+    @abstractmethod
+    def GetAUTH(self):
+        '''
+        Connect to AceEngine. Raises AceException if the engine is not available
+        '''
+
+    @abstractmethod
+    def GetCONTENTINFO(self, paramsdict):
+        '''
+        :return dict(status=, infohash=, files=[["Name", idx], ...]) for the requested content
+        '''
+
+    @abstractmethod
+    def GetBroadcastStartParams(self, paramsdict):
+        '''
+        Start broadcast
+        :return START params dict with playback url=
+        '''
+
+    @abstractmethod
+    def StopBroadcast(self):
+        '''
+        Stop broadcast, the session stays connected
+        '''
+
+    @abstractmethod
+    def ShutdownAce(self):
+        '''
+        Close the engine session
+        '''
+
+    @abstractmethod
+    def GetSTATUS(self):
+        '''
+        The latest broadcast status snapshot without waiting for the engine
+        '''
+
+    @abstractmethod
+    def GetLIVEPOS(self):
+        '''
+        The latest live position snapshot or None
+        '''
+
+def EngineClient(params):
+    '''
+    New AceEngine client of the configured backend: params['acebackend'] 'telnet' (default) or 'http'
+    '''
+    if params.get('acebackend', 'telnet') == 'http':
+       from .httpapi import AceHTTPClient
+       return AceHTTPClient(params)
+    from .aceclient import AceClient
+    return AceClient(params)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+'''
+Channel groups for BroadcastStreamer
+Equivalent sources of the same channel collected from all playlist plugins
+'''
+
+import re
+import logging
+from urllib3.packages.six.moves.urllib.parse import urlparse
+from urllib3.packages.six import ensure_text
+from .aceclient import AceException
+
+logger = logging.getLogger(__name__)
+
+# Source kind marks added by playlists to the same channel name: "X (2)", "X [3]", "X Reserva 1", "X (Backup)"
+_VARIANT = re.compile(r'[\s\-|]*(\(\s*(?:(?:reserva|backup|alt|opci.n|option)\s*)?\d*\s*\)|\[\s*\d+\s*\]|'
+                      r'\b(?:reserva|backup|alt|opci.n|option)\b\s*\d*)\s*$', re.I | re.U)
+# Playlist url scheme -> request type (the same mapping the plugins use for /{reqtype}/ paths)
+_REQTYPES = {'acestream': 'content_id', 'infohash': 'infohash', 'http': 'url', 'https': 'url'}
+
+class ChannelGroups(object):
+    '''
+    Channel name -> source url lists of the playlist plugins grouped into channels with several sources.
+    Sources are equivalent if their tvg-id or canonical name match (in any plugin).
+    Broadcast of a grouped source fails over to the other sources of its group
+    '''
+    def __init__(self):
+        self._plugins = {}  # {'plugin': [(name, url, tvgid), ...]}
+        self._groups = {}  # {(reqtype, value): [(reqtype, value), ...]} all sources of the source group
+
+    @staticmethod
+    def canonical(name):
+        '''
+        Channel name without variant marks, case and extra spaces: "DAZN 1 (2)", "DAZN 1 Reserva 2" -> "dazn 1"
+        '''
+        name, prev = ensure_text(name).strip(), None
+        while name != prev: name, prev = _VARIANT.sub('', name), name
+        return ' '.join(name.lower().split())
+
+    @staticmethod
+    def source(url):
+        '''
+        Playlist url -> (reqtype, value) or None for unsupported urls
+        '''
+        url = urlparse(url)
+        reqtype = _REQTYPES.get(url.scheme)
+        if not reqtype: return None
+        return (reqtype, url.geturl() if reqtype == 'url' else url.netloc)
+
+    def register(self, plugin, channels, tvgids=None):
+        '''
+        Replace sources of the plugin playlist
+        channels: {'name': 'url'}, tvgids: {'name': 'tvg-id'}
+        '''
+        tvgids = tvgids or {}
+        self._plugins[plugin] = [(name, url, tvgids.get(name, '')) for name, url in channels.items()]
+        self._rebuild()
+
+    @staticmethod
+    def current(params):
+        '''
+        Source (reqtype, value) of START params dict or None
+        '''
+        return next(((k, params[k]) for k in ('content_id', 'infohash', 'url') if params.get(k)), None)
+
+    def alternatives(self, params):
+        '''
+        Other sources of the channel group for START params dict
+        :return list of {reqtype: value} dicts in playlist order
+        '''
+        current = self.current(params)
+        return [{k: v} for k, v in self._groups.get(current, ()) if (k, v) != current]
+
+    def __len__(self):
+        return len(set(id(x) for x in self._groups.values()))
+
+    def _rebuild(self):
+        # Union-find over group keys: a source joins every group its tvg-id or canonical name belongs to
+        parent = {}
+        def find(key):
+            while parent.setdefault(key, key) != key:
+               parent[key] = parent[parent[key]]
+               key = parent[key]
+            return key
+
+        sources = []
+        for plugin in sorted(self._plugins):
+           for name, url, tvgid in self._plugins[plugin]:
+              source = self.source(url)
+              if not source: continue
+              keys = [('name', self.canonical(name))] + ([('tvgid', tvgid.lower())] if tvgid else [])
+              for key in keys[1:]: parent[find(key)] = find(keys[0])
+              sources.append((keys[0], source))
+
+        members = {}
+        for key, source in sources:
+           group = members.setdefault(find(key), [])
+           if source not in group: group.append(source)
+        self._groups = dict((source, group) for group in members.values() if len(group) > 1 for source in group)
+        logger.debug('[ChannelGroups]: %d channels with alternative sources', len(self))
+
+class SourceCollapsed(AceException):
+    '''
+    Bitrate or peer count of the active source of a broadcast collapsed
+    '''
@@ -5,99 +5,284 @@ Multi-channel support with Broadcast Manager
 __author__ = 'ValdikSS, AndreyPavlenko, Dorik1972'
 
 from itertools import chain
+from gevent.event import AsyncResult
 import gevent
 import logging
+import time
+from .ringbuffer import RingBuffer
+from .hlssegmenter import HLSSegmenter
+from .aceclient import AceException
+
+logger = logging.getLogger('BroadcastManager')
 
 class Broadcast(object):
     '''
     Represents a single broadcast channel with dedicated AceClient
-    Each broadcast has its own AceClient instance and shared queue for its clients
+    Each broadcast has its own AceClient instance and shared ring buffer for its clients
+    AceClient is taken from the broadcast engine (its session pool) and returned to it on shutdown
     '''
-    def __init__(self, infohash, params):
-        import aceclient
+    def __init__(self, infohash, params, engine=None):
         self.infohash = infohash
         self.clients = set()  # Set of clients watching this broadcast
         self.aceClient = None  # Dedicated AceClient for this broadcast
+        self.streamreader = None  # Greenlet filling the shared buffer from AceEngine
+        self.started = AsyncResult()  # START response from AceEngine (shared by all clients)
+        self.lingering = None  # Delayed removal greenlet while nobody is watching
+        self.lingersince = 0
+        self.pinned = None  # Pinned channel id for always-on broadcast
+        self.hls = None  # HLSSegmenter while HLS output of this broadcast is requested
         self.params = params
+        self.engine = engine  # AceEngine from EnginePool running this broadcast
+        # Shared video buffer for all clients
+        self.buffer = RingBuffer(params.get('videobuffersize', 33554432),
+                                 params.get('slowclientmaxlag', 10),
+                                 params.get('slowclientpolicy', 'skip'),
+                                 params.get('videofaststart', True))
+
+        self.aceClient = self._newClient()
+
+    def _newClient(self):
+        '''
+        Create dedicated AceClient for this broadcast (or take an authenticated one from the engine session pool)
+        '''
+        import aceclient
+        if self.engine:
+            client = self.engine.client()
+            logger.info('[Broadcast %s]: AceClient on engine %s ready', self.infohash[:8], self.engine)
+        else:
+            logger.debug('[Broadcast %s]: Creating dedicated AceClient', self.infohash[:8])
+            client = aceclient.EngineClient(self.params)
+            client.GetAUTH()
+            logger.info('[Broadcast %s]: AceClient created and authenticated', self.infohash[:8])
+        client._title = 'Broadcast_%s' % self.infohash[:8]  # Set title for logging
+        return client
+
+    def renewClient(self):
+        '''
+        Replace AceClient of the stalled broadcast with a fresh one. Clients stay attached
+        '''
+        try:
+            self.aceClient.StopBroadcast()
+            self.aceClient.ShutdownAce()
+        except Exception: pass
+        self.setClient(self._newClient())
+
+    def spareClient(self):
+        '''
+        One more AceClient on the broadcast engine (for race start of alternative sources)
+        '''
+        return self._newClient()
 
-        # Create dedicated AceClient for this broadcast
-        logging.debug('[Broadcast %s]: Creating dedicated AceClient' % infohash[:8])
-        self.aceClient = aceclient.AceClient(params)
-        self.aceClient.GetAUTH()
-        self.aceClient._title = 'Broadcast_%s' % infohash[:8]  # Set title for logging
-        logging.info('[Broadcast %s]: AceClient created and authenticated' % infohash[:8])
+    def setClient(self, client):
+        '''
+        Make client the AceClient of this broadcast. Clients stay attached
+        '''
+        self.aceClient = client
+        for c in self.clients: c.ace = client
+
+    def releaseClient(self, client):
+        '''
+        Stop the broadcast of client and return it to the engine (or shut it down)
+        '''
+        try:
+            client.StopBroadcast()
+            if self.engine:
+                self.engine.release(client)
+                logger.info('[Broadcast %s]: AceClient stopped and released to engine %s', self.infohash[:8], self.engine)
+            else:
+                client.ShutdownAce()
+                logger.info('[Broadcast %s]: AceClient shutdown completed', self.infohash[:8])
+        except Exception as e:
+            logger.error('[Broadcast %s]: Error during shutdown: %s', self.infohash[:8], repr(e))
 
     def addClient(self, client):
         '''Add a client to this broadcast'''
+        if self.lingering:
+            self.lingering.kill()
+            self.lingering = None
+            logger.info('[Broadcast %s]: Lingering broadcast re-adopted', self.infohash[:8])
         self.clients.add(client)
 
         # Assign broadcast's AceClient to the client
         client.ace = self.aceClient
+        client.broadcast = self
 
-        # Create INDIVIDUAL queue for this client (not shared!)
-        import acedefconfig as AceConfig
-        client.q = gevent.queue.Queue(maxsize=AceConfig.AceDefConfig.videotimeout)
+        # Create client read cursor over the shared broadcast buffer
+        client.cursor = self.buffer.reader()
 
-        logging.debug('[Broadcast %s]: Client added (total clients: %d)' % (self.infohash[:8], len(self.clients)))
+        logger.debug('[Broadcast %s]: Client added (total clients: %d)', self.infohash[:8], len(self.clients))
         return len(self.clients)
 
     def removeClient(self, client):
         '''Remove a client from this broadcast'''
         self.clients.discard(client)
         remaining = len(self.clients)
-        logging.debug('[Broadcast %s]: Client removed (remaining: %d)' % (self.infohash[:8], remaining))
+        logger.debug('[Broadcast %s]: Client removed (remaining: %d)', self.infohash[:8], remaining)
         return remaining
 
+    def startHLS(self):
+        '''
+        Start HLS output segmenter over the shared broadcast buffer (once per broadcast)
+        '''
+        if not self.hls:
+            self.hls = HLSSegmenter(self.buffer,
+                                    self.params.get('hlssegmentduration', 4),
+                                    self.params.get('hlswindow', 5),
+                                    self.params.get('hlstimeout', 30))
+            logger.info('[Broadcast %s]: HLS output started', self.infohash[:8])
+        return self.hls
+
+    def hlsIdle(self):
+        '''Seconds left until HLS viewers of this broadcast are considered gone'''
+        return self.hls.idle() if self.hls else 0
+
     def shutdown(self):
         '''Shutdown this broadcast and cleanup resources'''
-        logging.debug('[Broadcast %s]: Shutting down...' % self.infohash[:8])
-        try:
-            if self.aceClient:
-                self.aceClient.StopBroadcast()
-                self.aceClient.ShutdownAce()
-                logging.info('[Broadcast %s]: AceClient shutdown completed' % self.infohash[:8])
-        except Exception as e:
-            logging.error('[Broadcast %s]: Error during shutdown: %s' % (self.infohash[:8], repr(e)))
+        logger.debug('[Broadcast %s]: Shutting down...', self.infohash[:8])
+        if self.lingering:
+            self.lingering.kill()
+            self.lingering = None
+        if self.hls:
+            self.hls.stop()
+        if self.streamreader and self.streamreader is not gevent.getcurrent():
+            self.streamreader.kill(block=False)
+        self.buffer.close()
+        if self.aceClient:
+            self.releaseClient(self.aceClient)
 
 class BroadcastManager(object):
     '''
     Manages multiple broadcast channels
     Creates, reuses, and destroys Broadcast instances based on demand
     '''
-    def __init__(self):
+    def __init__(self, engines=None):
         self.broadcasts = {}  # Dictionary: {'infohash': Broadcast}
-        self.idleAce = False  # Temporary AceClient for getting content info (not for streaming)
-        logging.info('[BroadcastManager]: Initialized')
+        self.engines = engines  # EnginePool with idle sessions for content info and sessions for new broadcasts
+        self.creating = {}  # In-flight broadcast creations: {'infohash': AsyncResult}
+        logger.info('[BroadcastManager]: Initialized')
 
     def getOrCreateBroadcast(self, infohash, params):
         '''
         Get existing broadcast for this infohash or create a new one
         Returns: Broadcast instance
         '''
-        if infohash not in self.broadcasts:
-            logging.info('[BroadcastManager]: Creating new broadcast for infohash: %s (total broadcasts: %d -> %d)'
-                        % (infohash[:8], len(self.broadcasts), len(self.broadcasts) + 1))
-            self.broadcasts[infohash] = Broadcast(infohash, params)
+        broadcast = self.broadcasts.get(infohash)
+        if broadcast and broadcast.buffer.closed:
+            # Stream of the broadcast (lingering, pinned or not yet left by its clients) has already ended - start it from scratch
+            self.removeBroadcast(infohash)
+        if infohash in self.creating:
+            # Single-flight: wait for the creation already in progress and share its result or error
+            logger.debug('[BroadcastManager]: Waiting for broadcast creation for infohash: %s', infohash[:8])
+            return self.creating[infohash].get()
+        elif infohash not in self.broadcasts:
+            logger.info('[BroadcastManager]: Creating new broadcast for infohash: %s (total broadcasts: %d -> %d)',
+                         infohash[:8], len(self.broadcasts), len(self.broadcasts) + 1)
+            result = self.creating[infohash] = AsyncResult()
+            try:
+                self.broadcasts[infohash] = self._createBroadcast(infohash, params)
+                result.set(self.broadcasts[infohash])
+            except Exception as e:
+                result.set_exception(e)
+                raise
+            finally:
+                del self.creating[infohash]
         else:
-            logging.debug('[BroadcastManager]: Reusing existing broadcast for infohash: %s' % infohash[:8])
+            logger.debug('[BroadcastManager]: Reusing existing broadcast for infohash: %s', infohash[:8])
 
         return self.broadcasts[infohash]
 
+    def _createBroadcast(self, infohash, params):
+        '''
+        New broadcast on the least loaded engine. The next engines are tried if it is not available
+        '''
+        if not self.engines: return Broadcast(infohash, params)
+        error = None
+        for engine in self.engines.candidates(self.broadcasts.values()):
+            try: return Broadcast(infohash, params, engine)
+            except AceException as e:
+                logger.warning('[BroadcastManager]: Engine %s failed to create broadcast: %s', engine, repr(e))
+                error = e
+        raise error
+
+    def getContentInfo(self, params):
+        '''
+        Content info (infohash, files, etc) with the idle session of the least loaded engine
+        '''
+        return self.engines.select(self.broadcasts.values()).getContentInfo(params)
+
     def removeBroadcast(self, infohash):
         '''
         Remove and shutdown a broadcast when no more clients are watching
         '''
         if infohash in self.broadcasts:
-            logging.info('[BroadcastManager]: Removing broadcast for infohash: %s (total broadcasts: %d -> %d)'
-                        % (infohash[:8], len(self.broadcasts), len(self.broadcasts) - 1))
+            logger.info('[BroadcastManager]: Removing broadcast for infohash: %s (total broadcasts: %d -> %d)',
+                         infohash[:8], len(self.broadcasts), len(self.broadcasts) - 1)
             self.broadcasts[infohash].shutdown()
             del self.broadcasts[infohash]
         else:
-            logging.warning('[BroadcastManager]: Tried to remove non-existent broadcast: %s' % infohash[:8])
+            logger.warning('[BroadcastManager]: Tried to remove non-existent broadcast: %s', infohash[:8])
+
+    def releaseBroadcast(self, infohash):
+        '''
+        Broadcast has no more clients: cleanup it or keep it alive for a while to absorb channel zapping.
+        Pinned broadcasts keep running, broadcasts with HLS viewers linger until they are gone
+        '''
+        broadcast = self.broadcasts[infohash]
+        linger = broadcast.params.get('broadcastlinger', 0)
+        if broadcast.clients or broadcast.pinned or broadcast.lingering:
+            return
+        elif broadcast.streamreader and not broadcast.buffer.closed and max(linger, broadcast.hlsIdle()) > 0:
+            self.lingerBroadcast(infohash, max(linger, broadcast.hlsIdle()))
+        else:
+            logger.info('[BroadcastManager]: Nobody watches infohash: %s, removing broadcast', infohash[:8])
+            self.removeBroadcast(infohash)
+
+    def lingerBroadcast(self, infohash, timeout):
+        '''
+        Keep broadcast without clients alive for timeout seconds (with its AceClient and stream reader)
+        so the next client for the same infohash re-adopts it instead of starting it again
+        '''
+        broadcast = self.broadcasts[infohash]
+        logger.info('[BroadcastManager]: Broadcast for infohash: %s lingers for %s sec', infohash[:8], timeout)
+        broadcast.lingersince = time.time()
+        broadcast.lingering = gevent.spawn_later(timeout, self._lingerExpired, infohash)
+
+    def _lingerExpired(self, infohash):
+        broadcast = self.broadcasts.get(infohash)
+        if broadcast and not broadcast.clients and not broadcast.pinned:
+            broadcast.lingering = None
+            if broadcast.hlsIdle() > 0 and not broadcast.buffer.closed:
+                # HLS viewers are still polling the playlist
+                self.lingerBroadcast(infohash, broadcast.hlsIdle())
+                return
+            logger.info('[BroadcastManager]: Linger timeout expired for infohash: %s', infohash[:8])
+            self.removeBroadcast(infohash)
+
+    def evictLingering(self):
+        '''
+        Remove the oldest lingering broadcast to free a channel slot
+        Returns: True if a broadcast was removed
+        '''
+        lingering = [b for b in self.broadcasts.values() if b.lingering and not b.hlsIdle()]
+        if not lingering: return False
+        broadcast = min(lingering, key=lambda b: b.lingersince)
+        logger.info('[BroadcastManager]: Evicting lingering broadcast for infohash: %s', broadcast.infohash[:8])
+        self.removeBroadcast(broadcast.infohash)
+        return True
 
     def getBroadcastCount(self):
-        '''Returns the number of active broadcasts'''
-        return len(self.broadcasts)
+        '''Returns the number of active broadcasts (pinned are counted separately)'''
+        return len([b for b in self.broadcasts.values() if not b.pinned])
+
+    def getPinnedCount(self):
+        '''Returns the number of pinned always-on broadcasts'''
+        return len(self.broadcasts) - self.getBroadcastCount()
+
+    def getPinnedBroadcast(self, channel):
+        '''
+        Broadcast started for pinned channel or None
+        '''
+        return next((b for b in self.broadcasts.values() if b.pinned == channel), None)
 
     def getAllClientsList(self):
         '''
@@ -118,25 +303,30 @@ class ClientCounter(BroadcastManager):
     ClientCounter with BroadcastManager capabilities
     Maintains backward compatibility while adding multi-channel support
     '''
-    def __init__(self):
-        super(ClientCounter, self).__init__()
+    def __init__(self, engines=None):
+        super(ClientCounter, self).__init__(engines)
         self.clients = {}  # For backward compatibility: {'infohash': set([client1, client2,...])}
-        logging.info('[ClientCounter]: Initialized with BroadcastManager support')
+        logger.info('[ClientCounter]: Initialized with BroadcastManager support')
 
     def getClientsList(self, infohash):
         '''List of Clients by infohash (backward compatible)'''
         return self.clients.setdefault(infohash, set())
 
-    def addClient(self, client):
+    def removeBroadcast(self, infohash):
+        super(ClientCounter, self).removeBroadcast(infohash)
+        # Cleanup backward compatible dict
+        self.clients.pop(infohash, None)
+
+    def addClient(self, client, params=None):
         '''
         Adds client to a broadcast
-        Creates new broadcast if needed, or reuses existing one
+        Creates new broadcast if needed (with params, by default client attributes), or reuses existing one
         Returns the number of clients in this broadcast
         '''
-        logging.debug('[ClientCounter]: Adding client for infohash: %s' % client.infohash[:8])
+        logger.debug('[ClientCounter]: Adding client for infohash: %s', client.infohash[:8])
 
         # Get or create broadcast for this channel
-        broadcast = self.getOrCreateBroadcast(client.infohash, client.__dict__)
+        broadcast = self.getOrCreateBroadcast(client.infohash, params or client.__dict__)
 
         # Add client to broadcast (assigns ace and queue to client)
         client_count = broadcast.addClient(client)
@@ -144,8 +334,8 @@ class ClientCounter(BroadcastManager):
         # Maintain backward compatible clients dict (ensure set exists first)
         self.getClientsList(client.infohash).add(client)
 
-        logging.info('[ClientCounter]: Client added to infohash %s (clients in this broadcast: %d, total broadcasts: %d)'
-                    % (client.infohash[:8], client_count, self.getBroadcastCount()))
+        logger.info('[ClientCounter]: Client added to infohash %s (clients in this broadcast: %d, total broadcasts: %d)',
+                     client.infohash[:8], client_count, self.getBroadcastCount())
 
         return client_count
 
@@ -154,28 +344,26 @@ class ClientCounter(BroadcastManager):
         Remove client from broadcast
         Automatically cleanup broadcast if this was the last client
         '''
-        logging.debug('[ClientCounter]: Removing client for infohash: %s' % client.infohash[:8])
+        if getattr(client, 'broadcast', None) is None: return  # Client was not added (e.g. HLS output redirect)
+        logger.debug('[ClientCounter]: Removing client for infohash: %s', client.infohash[:8])
 
         try:
             # Remove from backward compatible dict
             self.clients[client.infohash].discard(client)
 
-            # Remove from broadcast
-            if client.infohash in self.broadcasts:
-                remaining = self.broadcasts[client.infohash].removeClient(client)
+            # Remove from broadcast (it may be already replaced by a new broadcast of the same infohash)
+            if self.broadcasts.get(client.infohash) is client.broadcast:
+                remaining = client.broadcast.removeClient(client)
 
-                # If no more clients, cleanup broadcast
+                # If no more clients, cleanup broadcast (or keep it alive for a while to absorb channel zapping)
                 if remaining == 0:
-                    logging.info('[ClientCounter]: Last client disconnected, removing broadcast for infohash: %s' % client.infohash[:8])
-                    self.removeBroadcast(client.infohash)
-                    # Cleanup backward compatible dict
-                    if client.infohash in self.clients:
-                        del self.clients[client.infohash]
+                    logger.info('[ClientCounter]: Last client disconnected from infohash: %s', client.infohash[:8])
+                    self.releaseBroadcast(client.infohash)
                 else:
-                    logging.debug('[ClientCounter]: Client removed, %d clients remaining in broadcast %s'
-                                % (remaining, client.infohash[:8]))
+                    logger.debug('[ClientCounter]: Client removed, %d clients remaining in broadcast %s',
+                                 remaining, client.infohash[:8])
 
         except KeyError:
-            logging.warning('[ClientCounter]: Client not found in dict for infohash: %s' % client.infohash[:8])
+            logger.warning('[ClientCounter]: Client not found in dict for infohash: %s', client.infohash[:8])
         except Exception as e:
-            logging.error('[ClientCounter]: Error deleting client: %s' % repr(e))
+            logger.error('[ClientCounter]: Error deleting client: %s', repr(e))
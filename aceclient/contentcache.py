@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+'''
+Content info cache for BroadcastStreamer
+LOADASYNC results (infohash, files, status) by content_id/infohash/url
+'''
+
+import os
+import time
+import logging
+from collections import OrderedDict
+from requests.compat import json
+
+logger = logging.getLogger(__name__)
+
+class ContentCache(object):
+    '''
+    LOADASYNC results cache with TTL and LRU eviction of the oldest used entries over maxsize.
+    Persisted to a JSON file (if filename is set) so it survives restarts.
+    ttl: seconds while the cached content info is valid (0 - cache disabled)
+    '''
+    REQTYPES = ('content_id', 'infohash', 'url')  # RAW torrent data is too big to be a key
+
+    def __init__(self, filename=None, ttl=86400, maxsize=1000):
+        self.filename = filename
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.changed = False
+        self._cache = OrderedDict()  # {'reqtype:value': (store time, content info)}
+        self.load()
+
+    def __len__(self):
+        return len(self._cache)
+
+    @staticmethod
+    def key(params):
+        '''
+        Cache key of request parameters or None if the request can't be cached
+        '''
+        return next(('%s:%s' % (x, params[x]) for x in ContentCache.REQTYPES if params.get(x)), None)
+
+    def get(self, key):
+        '''
+        Content info copy or None if it is not cached or expired
+        '''
+        if key not in self._cache: return None
+        stored, info = self._cache.pop(key)
+        if time.time() - stored > self.ttl:
+           self.changed = True
+           return None
+        self._cache[key] = (stored, info)  # The most recently used goes to the end
+        return dict(info)
+
+    def put(self, key, info):
+        '''
+        Store content info with status 1 or 2 (content is playable)
+        '''
+        if not key or self.ttl <= 0 or info.get('status') not in (1, 2): return
+        self._cache.pop(key, None)
+        self._cache[key] = (time.time(), dict(info))
+        while len(self._cache) > self.maxsize: self._cache.popitem(last=False)
+        self.changed = True
+
+    def discard(self, key):
+        if self._cache.pop(key, None): self.changed = True
+
+    def load(self):
+        if not self.filename or not os.path.isfile(self.filename): return
+        try:
+           with open(self.filename, 'r') as f:
+              now = time.time()
+              # JSON keeps entries in the LRU order
+              for key, stored, info in json.load(f):
+                 if now - stored <= self.ttl: self._cache[key] = (stored, info)
+           logger.info('[ContentCache]: %d content info entries loaded from %s', len(self._cache), self.filename)
+        except Exception as e:
+           logger.warning('[ContentCache]: Can\'t load %s: %r', self.filename, e)
+
+    def save(self):
+        '''
+        Write cache to file if it was changed since the last save
+        '''
+        if not self.filename or not self.changed: return
+        try:
+           tmpname = '%s.tmp' % self.filename
+           with open(tmpname, 'w') as f:
+              json.dump([[key, stored, info] for key, (stored, info) in self._cache.items()], f)
+           getattr(os, 'replace', os.rename)(tmpname, self.filename)  # os.replace overwrites on Windows too
+           self.changed = False
+           logger.debug('[ContentCache]: %d content info entries saved to %s', len(self._cache), self.filename)
+        except Exception as e:
+           logger.warning('[ContentCache]: Can\'t save %s: %r', self.filename, e)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+'''
+AceEngine pool for BroadcastStreamer
+Several AceEngines behind one proxy with least-loaded broadcast scheduling
+'''
+
+import logging
+import requests
+from .aceclient import AceException
+from .backend import EngineClient
+from .sessionpool import SessionPool
+
+logger = logging.getLogger(__name__)
+
+class Engine(object):
+    '''
+    One AceEngine: connection params, capacity weight and health state
+    with its own idle session for content info and session pool for broadcasts
+    '''
+    def __init__(self, params, weight=1, poolsize=0):
+        self.params = params  # AceClient params with this engine 'ace' connection dict
+        self.ace = params['ace']
+        self.weight = max(weight, 1)
+        self.healthy = True
+        self.idleAce = None  # Temporary AceClient for getting content info (not for streaming)
+        self.sessionpool = SessionPool(params, poolsize) if poolsize > 0 else None
+
+    def __repr__(self):
+        return '{aceHostIP}:{aceAPIport}'.format(**self.ace)
+
+    def client(self):
+        '''
+        Authenticated engine client for a new broadcast
+        '''
+        try:
+           if self.sessionpool: return self.sessionpool.get()
+           client = EngineClient(self.params)
+           client.GetAUTH()
+           return client
+        except AceException:
+           self.failed()
+           raise
+
+    def release(self, client):
+        '''
+        Stopped broadcast client goes back to the session pool or is shut down
+        '''
+        if self.sessionpool: self.sessionpool.put(client)
+        else: client.ShutdownAce()
+
+    def getContentInfo(self, params):
+        '''
+        Content info (infohash, files, etc) with the idle session of this engine
+        '''
+        if not self.idleAce:
+           logger.debug('Create temporary connection with AceStream on %s for CONTENTINFO', self)
+           self.idleAce = EngineClient(dict(params, ace=self.ace))
+           self.idleAce.GetAUTH()
+        return self.idleAce.GetCONTENTINFO(params)
+
+    def failed(self):
+        if self.healthy: logger.warning('[EnginePool]: AceEngine %s is not available', self)
+        self.healthy = False
+
+    def check(self, timeout=5):
+        '''
+        Health check with the engine HTTP API and session pool refill
+        '''
+        try:
+           with requests.get('http://{aceHostIP}:{aceHTTPport}/webui/api/service'.format(**self.ace),
+                             params={'method': 'get_version', 'format': 'json'}, timeout=timeout) as r:
+              r.raise_for_status()
+        except requests.exceptions.RequestException:
+           self.failed()
+        else:
+           if not self.healthy: logger.info('[EnginePool]: AceEngine %s is available again', self)
+           self.healthy = True
+           if self.sessionpool: self.sessionpool.check()
+
+    def close(self):
+        '''
+        Shut down idle sessions of this engine
+        '''
+        if self.idleAce:
+           try: self.idleAce.ShutdownAce()
+           except AceException: pass
+           self.idleAce = None
+        if self.sessionpool: self.sessionpool.close()
+
+class EnginePool(object):
+    '''
+    AceEngines sorted for new broadcasts by load: active broadcasts per capacity weight,
+    then measured download speed per weight. Unhealthy engines are used only if no engine is healthy
+    '''
+    def __init__(self, engines):
+        self.engines = list(engines)
+
+    def __iter__(self):
+        return iter(self.engines)
+
+    def __len__(self):
+        return len(self.engines)
+
+    def candidates(self, broadcasts):
+        '''
+        Engines in the order to try for a new broadcast
+        broadcasts: running Broadcast instances
+        '''
+        load = dict((id(e), [0, 0]) for e in self.engines)
+        for b in broadcasts:
+           if getattr(b, 'engine', None) is not None and id(b.engine) in load:
+              load[id(b.engine)][0] += 1
+              try: load[id(b.engine)][1] += int(b.aceClient.GetSTATUS().get('speed_down', 0))
+              except (ValueError, TypeError): pass
+        key = lambda e: (float(load[id(e)][0]) / e.weight, float(load[id(e)][1]) / e.weight)
+        return sorted([e for e in self.engines if e.healthy] or self.engines, key=key)
+
+    def select(self, broadcasts=()):
+        '''
+        The least loaded healthy engine
+        '''
+        return self.candidates(broadcasts)[0]
+
+    def check(self):
+        for engine in self.engines: engine.check()
+
+    def close(self):
+        for engine in self.engines: engine.close()
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+'''
+Lean readers for AceEngine HTTP and HLS video streams
+'''
+
+import time
+import logging
+import gevent
+import requests
+import m3u8
+from gevent import socket
+from gevent.pool import Pool
+from urllib3.packages.six.moves.urllib.parse import urlparse
+from .aceclient import AceException
+from .mpegts import packet_start, TS_PACKET_SIZE
+
+logger = logging.getLogger(__name__)
+
+class EngineStream(object):
+    '''
+    Reads AceEngine HTTP video stream from a raw socket.
+    Data is read as soon as it is available into a reusable buffer and yielded
+    in chunks aligned to TS packets when flushsize bytes are collected
+    or flushtime seconds have passed since the previous chunk.
+    '''
+    def __init__(self, url, timeout=30, connect_timeout=5, flushsize=TS_PACKET_SIZE * 5577, flushtime=1.0):
+        self.url = urlparse(url)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.flushsize = max(flushsize - flushsize % TS_PACKET_SIZE, TS_PACKET_SIZE)
+        self.flushtime = flushtime
+        self._socket = None
+        self._pending = bytearray()  # Received but not yet consumed response data
+        self._chunked = self._done = False
+        self._chunksize = 0
+        self._remaining = None  # Content-Length countdown
+
+    def __iter__(self):
+        self._socket = socket.create_connection((self.url.hostname, self.url.port or 80), self.connect_timeout)
+        try:
+           path = self.url.path + ('?' + self.url.query if self.url.query else '')
+           self._socket.sendall(('GET {} HTTP/1.1\r\nHost: {}\r\nUser-Agent: HTTPAceProxy\r\n'
+                                 'Accept: */*\r\nConnection: close\r\n\r\n'.format(path or '/', self.url.netloc)).encode('ascii'))
+           for chunk in self._read():
+              yield chunk
+        finally:
+           self.close()
+
+    def close(self):
+        if self._socket:
+           self._socket.close()
+           self._socket = None
+
+    def _headers(self):
+        '''
+        Read and parse response headers
+        '''
+        while b'\r\n\r\n' not in self._pending:
+           self._socket.settimeout(self.timeout)
+           data = self._socket.recv(4096)
+           if not data: raise AceException('AceEngine closed video stream connection without response')
+           self._pending += data
+        head, _, body = bytes(self._pending).partition(b'\r\n\r\n')
+        self._pending = bytearray(body)
+        lines = head.decode('latin-1').split('\r\n')
+        status = lines[0].split(None, 2)
+        if len(status) < 2 or status[1] not in ('200', '206'):
+           raise AceException('AceEngine video stream response: %s' % lines[0])
+        headers = dict((k.strip().lower(), v.strip()) for k, _, v in (l.partition(':') for l in lines[1:]))
+        self._chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        if 'content-length' in headers and not self._chunked: self._remaining = int(headers['content-length'])
+
+    def _readline(self, timeout):
+        while b'\r\n' not in self._pending:
+           self._socket.settimeout(timeout)
+           data = self._socket.recv(4096)
+           if not data: raise AceException('AceEngine video stream unexpectedly closed')
+           self._pending += data
+        line, _, rest = bytes(self._pending).partition(b'\r\n')
+        self._pending = bytearray(rest)
+        return line.strip()
+
+    def _recv_into(self, view, timeout):
+        '''
+        Read available response body data into view
+        Returns: number of bytes read, 0 at the end of the response body
+        '''
+        if self._chunked:
+           while not self._chunksize:
+              if self._done: return 0
+              line = self._readline(timeout)
+              if not line: continue  # CRLF after chunk data
+              self._chunksize = int(line.split(b';')[0], 16)
+              self._done = not self._chunksize
+           view = view[:self._chunksize]
+        elif self._remaining is not None:
+           view = view[:self._remaining]
+           if not self._remaining: return 0
+        if self._pending:
+           n = min(len(view), len(self._pending))
+           view[:n] = self._pending[:n]
+           del self._pending[:n]
+        else:
+           self._socket.settimeout(timeout)
+           n = self._socket.recv_into(view)
+           if not n and (self._chunked or self._remaining): raise AceException('AceEngine video stream unexpectedly closed')
+        if self._chunked: self._chunksize -= n
+        elif self._remaining is not None: self._remaining -= n
+        return n
+
+    def _read(self):
+        self._headers()
+        buf = bytearray(self.flushsize + 65536)  # Reusable read buffer
+        view = memoryview(buf)
+        fill, synced, flushed = 0, False, time.time()
+        received = flushed  # Time of the last received data
+        while 1:
+           timeout = min(self.flushtime, max(received + self.timeout - time.time(), 0.01)) if fill else self.timeout
+           try: n = self._recv_into(view[fill:], timeout)
+           except socket.timeout:
+              # A partial TS packet left in buffer is never flushed - stalled stream must not wait for it forever
+              if not fill or time.time() - received >= self.timeout: raise
+              n = -1  # Nothing new within flushtime - flush what we have
+           if n == 0: break
+           if n > 0: fill, received = fill + n, time.time()
+           if not synced and fill >= TS_PACKET_SIZE * 2:
+              start = packet_start(view[:TS_PACKET_SIZE * 2])
+              if start:
+                 view[:fill - start] = view[start:fill]
+                 fill -= start
+              synced = True
+           if synced and (fill >= self.flushsize or (fill and time.time() - flushed >= self.flushtime)):
+              end = fill - fill % TS_PACKET_SIZE
+              if end:
+                 yield bytes(view[:end])
+                 view[:fill - end] = view[end:fill]
+                 fill -= end
+                 flushed = time.time()
+        if fill: yield bytes(view[:fill])
+
+class HLSStream(object):
+    '''
+    AceEngine HLS stream ingest.
+    The playlist is polled on its target duration, new segments are fetched in parallel
+    over a keep-alive connection pool and yielded in media sequence order.
+    Segments are deduplicated by media sequence number
+    '''
+    def __init__(self, url, timeout=30, prefetch=3):
+        self.url = url
+        self.timeout = timeout
+        self.prefetch = max(prefetch, 1)
+
+    def __iter__(self):
+        with requests.Session() as session:
+           adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.prefetch)
+           session.mount('http://', adapter)
+           session.mount('https://', adapter)
+           pool = Pool(self.prefetch)
+           pending = {}  # {media sequence number: segment fetch greenlet}
+           nextseq, polltime, endlist = None, 0, False
+           try:
+              while 1:
+                 if not endlist and time.time() >= polltime:
+                    with session.get(self.url, timeout=self.timeout) as r:
+                       r.raise_for_status()
+                       playlist = m3u8.loads(r.text, uri=self.url)
+                    endlist = playlist.is_endlist
+                    first = playlist.media_sequence or 0
+                    if nextseq is None or nextseq < first: nextseq = first
+                    new = 0
+                    for seq, segment in enumerate(playlist.segments, first):
+                       if seq >= nextseq and seq not in pending:
+                          pending[seq] = pool.spawn(self._fetch, session, segment.absolute_uri)
+                          new += 1
+                    # Playlist unchanged - poll again after half of the target duration
+                    targetduration = playlist.target_duration or 1
+                    polltime = time.time() + (targetduration if new else targetduration / 2.0)
+                 if nextseq in pending:
+                    data = pending.pop(nextseq).get()
+                    nextseq += 1
+                    if data: yield data
+                 elif pending:
+                    nextseq = min(pending)
+                 elif endlist: break
+                 else: gevent.sleep(max(polltime - time.time(), 0))
+           finally:
+              pool.kill(block=False)
+
+    def _fetch(self, session, url):
+        try:
+           with session.get(url, timeout=self.timeout) as r:
+              r.raise_for_status()
+              return r.content
+        except requests.exceptions.RequestException as e:
+           logger.warning('HLS segment %s skipped: %r', url, e)
+           return b''
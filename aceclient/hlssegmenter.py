@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+'''
+HLS output for BroadcastStreamer
+Rolling in-memory HLS segments and live playlist made from the broadcast TS feed
+'''
+
+import time
+import gevent
+from collections import deque
+from gevent.event import Event
+
+class HLSSegmenter(object):
+    '''
+    Repackages the broadcast buffer into rolling HLS segments cut on video keyframes.
+    Segmenting runs once per broadcast regardless of the number of HLS viewers,
+    viewers get the prepared playlist and segments from memory.
+    duration: target segment duration (seconds)
+    window: number of segments in the live playlist
+    timeout: HLS viewers are gone if there were no requests for timeout seconds
+    '''
+    def __init__(self, ring, duration=4, window=5, timeout=30):
+        self.ring = ring
+        self.duration = duration
+        self.window = window
+        self.timeout = timeout
+        self.segments = deque()  # (media sequence number, duration, data)
+        self.sequence = 0        # Media sequence number of the next segment
+        self.playlist = None     # Prepared live playlist
+        self.accesstime = time.time()
+        self._ready = Event()    # Set when the first segment is ready
+        self._greenlet = gevent.spawn(self._run)
+
+    def stop(self):
+        self._greenlet.kill(block=False)
+
+    def idle(self):
+        '''
+        Seconds left until HLS viewers are considered gone (0 - nobody watches)
+        '''
+        return max(self.timeout - (time.time() - self.accesstime), 0)
+
+    def getPlaylist(self, timeout=None):
+        '''
+        Live playlist. Waits for the first segment at most timeout seconds
+        '''
+        self.accesstime = time.time()
+        self._ready.wait(timeout)
+        return self.playlist
+
+    def getSegment(self, sequence):
+        '''
+        Segment data by media sequence number or None
+        '''
+        self.accesstime = time.time()
+        if self.segments and self.segments[0][0] <= sequence < self.sequence:
+           return self.segments[sequence - self.segments[0][0]][2]
+        return None
+
+    def _run(self):
+        ring = self.ring
+        joinpoint = ring.joinpoint()
+        seq, pos = joinpoint if joinpoint else (ring.last, 0)
+        parts, starttime = [], None
+        while 1:
+           while seq >= ring.last:
+              if ring.closed: return
+              ring.wait()
+           if seq < ring.first: seq, pos = ring.first, 0
+           offset, chunktime, chunk = ring.entry(seq)
+           seq += 1
+           if pos: offset, chunk, pos = offset + pos, chunk[pos:], 0
+           if starttime is None: starttime = chunktime
+           if parts and chunktime - starttime >= self.duration:
+              # Cut on the first keyframe in this chunk (or on the chunk start without keyframe information)
+              keyframes = ring.scanner.keyframes if ring.scanner and ring.scanner.video_pid is not None else None
+              cut = next((k - offset for k in keyframes if offset <= k < offset + len(chunk)), None) if keyframes is not None else 0
+              if cut is not None:
+                 if cut: parts.append(chunk[:cut])
+                 self._addSegment(parts, chunktime - starttime)
+                 parts, starttime, chunk = [], chunktime, chunk[cut:]
+           if chunk: parts.append(chunk)
+
+    def _addSegment(self, parts, duration):
+        psi = self.ring.scanner.psi if self.ring.scanner else b''
+        self.segments.append((self.sequence, duration, psi + b''.join(parts)))
+        self.sequence += 1
+        # Keep a couple of segments out of the playlist for viewers still downloading them
+        while len(self.segments) > self.window + 2: self.segments.popleft()
+        live = list(self.segments)[-self.window:]
+        self.playlist = ''.join(['#EXTM3U\n#EXT-X-VERSION:3\n',
+                                 '#EXT-X-TARGETDURATION:%d\n' % int(max(d for _, d, _ in live) + 0.999),
+                                 '#EXT-X-MEDIA-SEQUENCE:%d\n' % live[0][0]] +
+                                ['#EXTINF:%.3f,\n%d.ts\n' % (d, n) for n, d, _ in live]).encode('ascii')
+        self._ready.set()
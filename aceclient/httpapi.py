@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+'''
+AceEngine HTTP API backend
+'''
+
+import gevent
+import logging
+import time
+import hashlib
+import requests
+from uuid import uuid4
+from urllib3.packages.six import ensure_binary
+from .acemessages import AceConst
+from .aceclient import AceException
+from .backend import EngineBackend
+
+logger = logging.getLogger(__name__)
+
+class AceHTTPClient(EngineBackend):
+    '''
+    AceEngine HTTP API client.
+    Goes from content id straight to the playback url with /ace/getstream (or /ace/manifest.m3u8 for
+    output_format=hls) without LOADASYNC/AUTH/START. The started broadcast is monitored with its stat_url
+    and stopped with its command_url
+    '''
+    # Request types with HTTP API parameter names
+    REQTYPES = {'content_id': 'id', 'infohash': 'infohash', 'url': 'url'}
+
+    def __init__(self, params):
+        self._engine = 'http://{aceHostIP}:{aceHTTPport}'.format(**params.get('ace'))
+        self._responsetimeout = params.get('result_timeout', 5)
+        self._videotimeout = params.get('videotimeout', 30)
+        self._session = requests.Session()
+        self._closed = False
+        self._title = 'httpAce'
+        self._stat_url = self._command_url = None
+        self._poller = None
+        self._status = self._livepos = None
+
+    def __bool__(self):
+        return not self._closed
+
+    def __nonzero__(self):  # For Python 2 backward compatible
+        return self.__bool__()
+
+    def _get(self, url, params=None, timeout=None):
+        '''
+        HTTP API request :return JSON answer
+        '''
+        try:
+           with self._session.get(url, params=params, timeout=timeout or self._responsetimeout) as r:
+              r.raise_for_status()
+              answer = r.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+           raise AceException('AceEngine HTTP API request failed: %s' % repr(e))
+        if answer.get('error'):
+           raise AceException('AceEngine HTTP API error: %s' % answer['error'])
+        return answer
+
+    def _reqtype(self, paramsdict):
+        reqtype = next((x for x in AceHTTPClient.REQTYPES if paramsdict.get(x)), None)
+        if not reqtype: raise AceException('Request type is not supported by AceEngine HTTP API backend')
+        return reqtype
+
+    def GetAUTH(self):
+        '''
+        Nothing to authenticate - just check the engine is alive
+        '''
+        self._get(self._engine + '/webui/api/service', {'method': 'get_version', 'format': 'json'})
+
+    def GetCONTENTINFO(self, paramsdict):
+        '''
+        HTTP API has no LOADASYNC: broadcast key is the infohash itself or a hash of the content id/url
+        '''
+        reqtype = self._reqtype(paramsdict)
+        if reqtype == 'infohash': infohash = paramsdict['infohash']
+        else: infohash = hashlib.sha1(ensure_binary('%s:%s' % (reqtype, paramsdict[reqtype]))).hexdigest()
+        return {'status': 1, 'infohash': infohash, 'files': []}
+
+    def GetBroadcastStartParams(self, paramsdict):
+        reqtype = self._reqtype(paramsdict)
+        query = dict(x.split('=', 1) for x in paramsdict.get('stream_type', '').split() if '=' in x)
+        hls = query.pop('output_format', 'http') == 'hls'
+        query.update({AceHTTPClient.REQTYPES[reqtype]: paramsdict[reqtype], 'format': 'json', 'pid': uuid4().hex})
+        if paramsdict.get('file_indexes', '0') != '0': query['file_indexes'] = paramsdict['file_indexes']
+        response = self._get(self._engine + ('/ace/manifest.m3u8' if hls else '/ace/getstream'), query, self._videotimeout)['response']
+        self._stat_url, self._command_url = response.get('stat_url'), response.get('command_url')
+        if self._stat_url: self._poller = gevent.spawn(self._poll, self._stat_url)
+        logger.debug('[%.20s]: <<< %s', self._title, response)
+        return {'url': response['playback_url'],
+                'infohash': response.get('infohash', ''),
+                'stream': str(response.get('is_live', 1)),
+               }
+
+    def _poll(self, stat_url, interval=1):
+        '''
+        Keep the latest broadcast status and live position from stat_url
+        '''
+        while 1:
+           try:
+              response = self._get(stat_url)['response'] or {}
+              self._status = {k: str(response.get(k, 0)) for k in AceConst.STATUS}
+              self._status['updated'] = time.time()
+              if response.get('livepos'): self._livepos = dict(response['livepos'], updated=time.time())
+           except AceException as e:
+              logger.debug('[%.20s]: %s', self._title, e)
+           gevent.sleep(interval)
+
+    def StopBroadcast(self):
+        if self._poller: self._poller.kill(block=False)
+        command_url, self._poller, self._stat_url, self._command_url = self._command_url, None, None, None
+        self._status = self._livepos = None
+        if command_url: self._get(command_url, {'method': 'stop'})
+
+    def ShutdownAce(self):
+        if self._poller: self._poller.kill(block=False)
+        self._closed = True
+        self._session.close()
+
+    def GetSTATUS(self):
+        return dict(self._status) if self._status else {'status': 'error'}
+
+    def GetLIVEPOS(self):
+        return dict(self._livepos) if self._livepos else None
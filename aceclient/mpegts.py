@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+'''
+Minimal MPEG-TS helpers for BroadcastStreamer
+'''
+from urllib3.packages.six import PY2
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+
+def packet_start(data, offset=0):
+    '''
+    Position of the first TS packet boundary in data.
+    offset: absolute stream position of data[0] (stream starts on a packet boundary)
+    Falls back to sync byte search if the expected position does not hold a sync byte.
+    Returns 0 if no packet boundary found
+    '''
+    data = bytearray(data[:TS_PACKET_SIZE * 2])
+    pos = -offset % TS_PACKET_SIZE
+    if pos < len(data) and data[pos] == TS_SYNC_BYTE: return pos
+    for pos in range(min(TS_PACKET_SIZE, len(data))):
+       if data[pos] == TS_SYNC_BYTE and (pos + TS_PACKET_SIZE >= len(data) or data[pos + TS_PACKET_SIZE] == TS_SYNC_BYTE):
+          return pos
+    return 0
+
+def discontinuity(scanner):
+    '''
+    TS discontinuity marker: adaptation field only packet with discontinuity_indicator
+    for every known PID followed by PAT/PMT, so decoders resync at the join of two streams.
+    scanner: TSScanner of the stream (None - empty marker)
+    '''
+    if not scanner or not scanner.psi: return b''
+    pids = sorted(set(scanner.pids + ((scanner.pcr_pid,) if scanner.pcr_pid is not None else ())))
+    packets = [bytes(bytearray([TS_SYNC_BYTE, pid >> 8 & 0x1F, pid & 0xFF, 0x20, 183, 0x80]) + b'\xff' * 182) for pid in pids]
+    return b''.join(packets) + scanner.psi
+
+# PMT stream types of video elementary streams (MPEG-1/2, MPEG-4, H.264, HEVC, VC-1, AVS)
+VIDEO_STREAM_TYPES = (0x01, 0x02, 0x10, 0x1B, 0x24, 0x42, 0xEA)
+
+def section(packet):
+    '''
+    PSI section data from a TS packet with payload_unit_start_indicator set
+    '''
+    pos = 4
+    if packet[3] & 0x20: pos += 1 + packet[4]  # adaptation field
+    pos += 1 + packet[pos]                     # pointer field
+    return packet[pos:]
+
+class TSScanner(object):
+    '''
+    Follows PAT/PMT of a TS stream and finds video keyframes
+    (payload unit start with random_access_indicator on the video PID).
+    Keeps the last PAT and PMT packets to be sent to new clients before a keyframe
+    '''
+    def __init__(self, maxkeyframes=16):
+        self.pat = self.pmt = None  # Last PAT/PMT packets
+        self.pmt_pid = self.video_pid = self.pcr_pid = None
+        self.pids = ()              # Elementary stream PIDs from PMT
+        self.keyframes = []         # Stream offsets of the last keyframes
+        self._maxkeyframes = maxkeyframes
+        self._tail = b''            # Beginning of the packet split between chunks
+        self._tailoffset = 0
+
+    def scan(self, chunk, offset):
+        '''
+        Scan chunk placed at stream offset
+        '''
+        data = bytearray(chunk) if PY2 else chunk
+        pos = 0
+        if self._tail:
+           if self._tailoffset + len(self._tail) == offset:
+              pos = TS_PACKET_SIZE - len(self._tail)
+              if pos > len(data):  # Packet continues in the next chunk too
+                 self._tail += bytes(data)
+                 return
+              self._packet(bytearray(self._tail + data[:pos]), self._tailoffset)
+           self._tail = b''
+        if pos >= len(data): return
+        pos += packet_start(data[pos:pos + TS_PACKET_SIZE * 2], offset + pos)
+        end = pos + (len(data) - pos) // TS_PACKET_SIZE * TS_PACKET_SIZE
+        # Only packets with payload_unit_start_indicator are interesting
+        for i, b1 in enumerate(data[pos + 1:end:TS_PACKET_SIZE]):
+           if b1 & 0x40:
+              start = pos + i * TS_PACKET_SIZE
+              self._packet(bytearray(data[start:start + TS_PACKET_SIZE]), offset + start)
+        if end < len(data):
+           self._tail, self._tailoffset = bytes(data[end:]), offset + end
+
+    def _packet(self, packet, offset):
+        if packet[0] != TS_SYNC_BYTE or not packet[1] & 0x40: return
+        pid = (packet[1] & 0x1F) << 8 | packet[2]
+        try:
+           if pid == 0: self._parse_pat(packet)
+           elif pid == self.pmt_pid: self._parse_pmt(packet)
+           elif pid == self.video_pid and packet[3] & 0x20 and packet[4] and packet[5] & 0x40 and self.pmt:
+              self.keyframes.append(offset)
+              if len(self.keyframes) > self._maxkeyframes: del self.keyframes[0]
+        except IndexError: pass # Section does not fit in one packet
+
+    def _parse_pat(self, packet):
+        data = section(packet)
+        end = min(3 + ((data[1] & 0x0F) << 8 | data[2]) - 4, len(data))  # without CRC32
+        for i in range(8, end - 3, 4):
+           if data[i] << 8 | data[i + 1]:  # program_number 0 is the network PID
+              pmt_pid = (data[i + 2] & 0x1F) << 8 | data[i + 3]
+              if pmt_pid != self.pmt_pid: self.pmt_pid, self.pmt = pmt_pid, None
+              self.pat = bytes(packet)
+              return
+
+    def _parse_pmt(self, packet):
+        data = section(packet)
+        end = min(3 + ((data[1] & 0x0F) << 8 | data[2]) - 4, len(data))
+        self.pcr_pid = (data[8] & 0x1F) << 8 | data[9]
+        i = 12 + ((data[10] & 0x0F) << 8 | data[11])
+        pids, video_pid = [], None
+        while i + 5 <= end:
+           pid = (data[i + 1] & 0x1F) << 8 | data[i + 2]
+           pids.append(pid)
+           if video_pid is None and data[i] in VIDEO_STREAM_TYPES: video_pid = pid
+           i += 5 + ((data[i + 3] & 0x0F) << 8 | data[i + 4])
+        self.pids, self.video_pid = tuple(pids), video_pid
+        self.pmt = bytes(packet)
+
+    @property
+    def psi(self):
+        '''PAT and PMT packets to be sent before a keyframe'''
+        return self.pat + self.pmt if self.pat and self.pmt else b''
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+'''
+Shared video buffer for BroadcastStreamer
+One append-only ring of chunks per Broadcast with an independent read cursor per client
+'''
+
+import time
+from collections import deque
+from gevent.event import Event
+from .mpegts import packet_start, TSScanner
+
+class SlowClientError(Exception):
+    '''
+    Client lag exceeded the allowed limit with 'disconnect' slow client policy
+    '''
+    pass
+
+class RingBuffer(object):
+    '''
+    Append-only ring of video chunks.
+    The writer never waits for readers: the oldest chunks are dropped
+    as soon as the buffer grows over maxsize bytes.
+
+    Slow clients are handled by their read cursors according to policy:
+      skip       - jump to the live edge
+      drop       - drop the oldest unread chunks until client lag is within maxlag
+      disconnect - close client connection
+    maxlag: allowable client lag in seconds of media (0 - limited by buffer size only)
+
+    With faststart new clients start from the last buffered keyframe preceded by PAT/PMT
+    instead of the live edge, so the player can start decoding at once
+    '''
+    POLICIES = ('skip', 'drop', 'disconnect')
+
+    def __init__(self, maxsize=33554432, maxlag=10, policy='skip', faststart=True):
+        self.maxsize = maxsize    # Max buffered bytes per broadcast (not per client!)
+        self.maxlag = maxlag
+        self.policy = policy if policy in RingBuffer.POLICIES else 'skip'
+        self.scanner = TSScanner() if faststart else None
+        self.size = 0             # Currently buffered bytes
+        self.first = 0            # Sequence number of the oldest chunk in buffer
+        self.offset = 0           # Absolute stream position of the next chunk
+        self.closed = False
+        self._chunks = deque()    # (stream offset, arrival time, chunk)
+        self._newdata = Event()   # New Event for each chunk - wakes up all waiting readers
+
+    def __len__(self):
+        return len(self._chunks)
+
+    @property
+    def last(self):
+        '''Sequence number of the next chunk to be written (live edge)'''
+        return self.first + len(self._chunks)
+
+    def put(self, chunk):
+        '''
+        Append chunk and wake up all waiting readers
+        '''
+        if self.scanner: self.scanner.scan(chunk, self.offset)
+        self._chunks.append((self.offset, time.time(), chunk))
+        self.offset += len(chunk)
+        self.size += len(chunk)
+        while self.size > self.maxsize and len(self._chunks) > 1:
+           self.size -= len(self._chunks.popleft()[2])
+           self.first += 1
+        newdata, self._newdata = self._newdata, Event()
+        newdata.set()
+
+    def entry(self, seq):
+        '''
+        (stream offset, arrival time, chunk) by sequence number
+        '''
+        return self._chunks[seq - self.first]
+
+    def get(self, seq):
+        '''
+        Chunk by sequence number
+        '''
+        return self.entry(seq)[2]
+
+    def age(self, seq):
+        '''
+        Seconds since the chunk arrived from the engine
+        '''
+        return time.time() - self.entry(seq)[1]
+
+    def joinpoint(self):
+        '''
+        (sequence number, position in chunk) of the last buffered keyframe or None
+        '''
+        if not self.scanner or not self.scanner.keyframes or not self._chunks: return None
+        keyframe = self.scanner.keyframes[-1]
+        for seq in range(self.last - 1, self.first - 1, -1):
+           offset = self.entry(seq)[0]
+           if offset <= keyframe:
+              if 0 < self.maxlag < self.age(seq): return None
+              return seq, keyframe - offset
+        return None
+
+    def wait(self, timeout=None):
+        '''
+        Wait for the next chunk
+        '''
+        return self._newdata.wait(timeout)
+
+    def close(self):
+        '''
+        End of stream. Readers stop after the last buffered chunk
+        '''
+        self.closed = True
+        self._newdata.set()
+
+    def reader(self):
+        return RingReader(self)
+
+class RingReader(object):
+    '''
+    Client read cursor over RingBuffer.
+    Starts from the last keyframe (or the live edge), iteration ends when the buffer is closed
+    '''
+    def __init__(self, ring):
+        self.ring = ring
+        self.seq = ring.last
+        self.offset = ring.offset  # Stream offset of the end of the last read chunk
+        self.skipped = 0  # How many times the slow client policy was applied
+        self._head = []   # PAT/PMT and keyframe data to be sent before the next buffered chunk
+        joinpoint = ring.joinpoint()
+        if joinpoint:
+           self.seq, pos = joinpoint
+           offset, _, chunk = ring.entry(self.seq)
+           self._head = [data for data in (ring.scanner.psi, chunk[pos:]) if data]
+           self.offset = offset + len(chunk)
+           self.seq += 1
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._head: return self._head.pop(0)
+        ring = self.ring
+        while self.seq >= ring.last:
+           if ring.closed: raise StopIteration
+           ring.wait()
+        if self.seq < ring.first or 0 < ring.maxlag < ring.age(self.seq):
+           return self._catchup()
+        offset, _, chunk = ring.entry(self.seq)
+        self.offset = offset + len(chunk)
+        self.seq += 1
+        return chunk
+
+    next = __next__  # For Python 2 backward compatible
+
+    def _catchup(self):
+        '''
+        Apply slow client policy. Client continues from a TS packet boundary
+        '''
+        ring = self.ring
+        if ring.policy == 'disconnect':
+           # Chunks behind the cursor may already be dropped from the buffer - their age is at least the oldest one's
+           raise SlowClientError('Client lag %s%.1f sec (%d chunks, %d bytes) exceeded' % ('>' if self.seq < ring.first else '',
+                                 self.lag, ring.last - self.seq, ring.offset - self.offset))
+        elif ring.policy == 'skip':
+           self.seq = ring.last - 1
+        else:
+           self.seq = max(self.seq, ring.first)
+           while self.seq < ring.last - 1 and 0 < ring.maxlag < ring.age(self.seq): self.seq += 1
+        self.skipped += 1
+        offset, _, chunk = ring.entry(self.seq)
+        self.offset = offset + len(chunk)
+        self.seq += 1
+        return chunk[packet_start(chunk, offset):]
+
+    @property
+    def lag(self):
+        '''Client lag in seconds of media behind the live edge'''
+        seq = max(self.seq, self.ring.first)
+        return self.ring.age(seq) if seq < self.ring.last else 0.0
+
+    @property
+    def pending(self):
+        '''Number of buffered chunks not yet read by client'''
+        return self.ring.last - max(self.seq, self.ring.first)
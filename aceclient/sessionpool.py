@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+'''
+AceClient session pool for BroadcastStreamer
+Authenticated idle AceEngine API sessions ready to START a broadcast at once
+'''
+
+import gevent
+import logging
+from collections import deque
+from .aceclient import AceException
+from .backend import EngineClient
+
+logger = logging.getLogger(__name__)
+
+class SessionPool(object):
+    '''
+    Keeps up to size authenticated idle AceClient sessions warm.
+    A new broadcast gets a session without TCP connect and HELLOBG/READY/AUTH handshake,
+    a stopped broadcast returns its session after STOP instead of shutting it down.
+    Idle pooled sessions are not closed on read timeout, a session handed out to a broadcast is.
+    Dead sessions are dropped and the pool is refilled in background
+    '''
+    def __init__(self, params, size=2):
+        self.params = params
+        self.size = size
+        self._idle = deque()
+        self._filling = None
+
+    def __len__(self):
+        return len(self._idle)
+
+    def get(self):
+        '''
+        Healthy idle session or a new one if the pool is empty
+        '''
+        while self._idle:
+           session = self._idle.popleft()
+           if session:
+              session.pooled = False
+              self.fill()
+              return session
+        self.fill()
+        session = self._connect()
+        session.pooled = False
+        return session
+
+    def put(self, session):
+        '''
+        Return stopped session to the pool or shut it down if the pool is full
+        '''
+        if session and len(self._idle) < self.size:
+           session._title = 'pooledAce'
+           session.pooled = True
+           self._idle.append(session)
+        else:
+           try: session.ShutdownAce()
+           except AceException: pass
+
+    def check(self):
+        '''
+        Health check: drop dead sessions and refill the pool
+        '''
+        self._idle = deque(session for session in self._idle if session)
+        self.fill()
+
+    def fill(self):
+        '''
+        Refill the pool in background
+        '''
+        if len(self._idle) < self.size and not self._filling:
+           self._filling = gevent.spawn(self._fill)
+
+    def close(self):
+        '''
+        Shut down all idle sessions
+        '''
+        if self._filling: self._filling.kill()
+        while self._idle:
+           try: self._idle.pop().ShutdownAce()
+           except AceException: pass
+
+    def _connect(self):
+        session = EngineClient(self.params)
+        session.GetAUTH()
+        session._title = 'pooledAce'
+        session.pooled = True
+        return session
+
+    def _fill(self):
+        try:
+           while len(self._idle) < self.size:
+              self._idle.append(self._connect())
+           logger.debug('[SessionPool]: %d idle AceEngine sessions ready', len(self._idle))
+        except Exception as e:
+           logger.warning('[SessionPool]: Can\'t create AceEngine session: %r', e)
+        finally:
+           self._filling = None
@@ -41,6 +41,6 @@ class AceConfig(acedefconfig.AceDefConfig):
     # firewallnetranges = ('127.0.0.1', '192.168.0.0/16', '10.0.0.0/8')
 
     # Logging
-    # loglevel = logging.INFO
+    # loglevel = logging.DEBUG
 
     pass
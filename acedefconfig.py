@@ -21,8 +21,22 @@ class AceDefConfig(object):
     acestartuptimeout = 10
     aceconntimeout = 5
     aceresulttimeout = 5
+    # AceEngine backend: 'telnet' - engine API port (LOADASYNC/START), 'http' - engine HTTP API on aceHTTPport
+    # (/ace/getstream or /ace/manifest.m3u8 for output_format hls) without LOADASYNC/AUTH/START round-trips
+    acebackend = 'telnet'
+    # Number of authenticated idle AceEngine API sessions kept ready for new broadcasts (0 - pool disabled).
+    # Stopped broadcasts return their sessions to the pool. Dead sessions are replaced every acesessioncheckinterval seconds
+    acesessionpool = 2
+    acesessioncheckinterval = 30
+    # Several AceEngines behind one proxy (empty - only ace engine is used). New broadcasts go to the least loaded
+    # healthy engine by active broadcasts per weight, then by download speed. Health is checked every acesessioncheckinterval
+    #aceengines = ({'aceHostIP': '10.0.0.2', 'aceAPIport': '62062', 'aceHTTPport': '6878', 'weight': 2},
+    #              {'aceHostIP': '10.0.0.3', 'aceAPIport': '62062', 'aceHTTPport': '6878', 'weight': 1},)
+    aceengines = ()
     httphost = ''
     httpport = 8888
+    # Seconds to keep an idle HTTP/1.1 keep-alive connection (playlists, API, HLS) open waiting for the next request
+    httpkeepalivetimeout = 15
     aceproxyuser = ''
     firewall = False
     firewallblacklistmode = False
@@ -32,6 +46,14 @@ class AceDefConfig(object):
         )
     maxconns = 10
     maxconcurrentchannels = 5  # Maximum number of different channels (broadcasts) streaming simultaneously
+    # Admission control: a request over maxconns or maxconcurrentchannels waits up to admissionwait seconds
+    # for a free slot (0 - rejected at once) in a queue of at most admissionqueue requests, admissionperip of them
+    # from one client IP. Viewers of pinned and running channels go first, then clients with fewer streams.
+    # Rejected requests get 403/503 with Retry-After: admissionretryafter seconds
+    admissionwait = 10
+    admissionqueue = 20
+    admissionperip = 2
+    admissionretryafter = 15
     acestreamtype = {'output_format': 'http'}
     # Example for hls-steam request from AceEngine
     #acestreamtype = {'output_format': 'hls', 'transcode_audio': 0, 'transcode_mp3': 0, 'transcode_ac3': 0, 'preferred_audio_language': 'rus'}
@@ -39,12 +61,94 @@ class AceDefConfig(object):
     #transcodecmd['default'] = 'ffmpeg -i - -c:a copy -c:v copy -f mpegts -'.split()
     videoseekback = 0
     videotimeout = 30
+    # Size in bytes of the video buffer shared by all clients of one broadcast
+    # Memory use is videobuffersize per channel regardless of the number of clients
+    videobuffersize = 33554432
+    # What to do with a client that lags behind the live edge more than slowclientmaxlag seconds of media
+    # (0 - only when its data has already left the shared buffer):
+    # 'skip' - jump to the live edge, 'drop' - drop the oldest unread data, 'disconnect' - close connection
+    # Slow client never delays the other clients of the same broadcast
+    slowclientpolicy = 'skip'
+    slowclientmaxlag = 10
+    # Start new clients of an already running broadcast from the last buffered keyframe (with PAT/PMT)
+    # instead of the live edge for sub-second channel start
+    videofaststart = True
+    # Seconds to keep a broadcast running after its last client disconnected (0 - stop at once).
+    # A client coming back to the same channel within this time gets it without a new engine START
+    broadcastlinger = 15
+    # Always-on channels: broadcasts are started at startup and restarted if they die.
+    # They are not counted in maxconcurrentchannels. Items: 'content_id:<id>', 'infohash:<infohash>' or '<content_id>'
+    # Can be changed at runtime from the local network with /stat?action=pin&channel=<item> and /stat?action=unpin&channel=<item>
+    pinnedchannels = ()
+    # Maximum number of pinned broadcasts running at once (0 - no limit)
+    maxpinned = 5
+    # Pinned channels watchdog check interval (seconds)
+    pinnedcheckinterval = 30
+    # AceEngine HTTP video stream is sent to clients in chunks aligned to TS packets as soon as
+    # streamflushsize bytes are read or streamflushtime seconds have passed since the previous chunk.
+    # streamflushsize is in bytes and is rounded down to whole 188-byte TS packets (default 5577 packets, ~1 MiB)
+    streamflushsize = 188 * 5577
+    streamflushtime = 1.0
+    # Low latency mode (e.g. for live sports): flush every streamlowlatencyflushsize bytes (rounded down to whole
+    # 188-byte TS packets, default 348 packets) or streamlowlatencyflushtime seconds
+    streamlowlatency = False
+    streamlowlatencyflushsize = 188 * 348
+    streamlowlatencyflushtime = 0.1
+    # Stalled live stream recovery: no data for streamstalltimeout seconds (or stream error) reconnects the stream,
+    # then re-sends START, then re-sends START with a fresh AceClient while clients stay connected.
+    # Clients are disconnected after streamrecoveries failed attempts in a row (0 - at once)
+    streamstalltimeout = 10
+    streamrecoveries = 3
+    # Multi-source failover: playlist plugin channels with the same tvg-id or name (without variant marks
+    # like "X (2)" or "X Reserva 1") are sources of one channel. The broadcast switches to the next source
+    # while clients stay connected if the current one fails all recovery attempts or, while downloading,
+    # has less than failoverminpeers peers or less than failoverminspeed KiB/s for failovergrace seconds
+    sourcefailover = True
+    failoverminpeers = 1
+    failoverminspeed = 16
+    failovergrace = 20
+    # Race start: START the first racestart sources of a channel with alternative sources in parallel
+    # (on extra sessions of the same engine) and keep the one which delivers TS data first (0 - disabled)
+    racestart = 0
+    # Number of HLS segments fetched in parallel when AceEngine returns HLS stream (acestreamtype output_format: hls)
+    hlsprefetch = 3
+    # Built-in HLS output: requests like /content_id/<id>/stream.m3u8 are redirected to /hls/<infohash>/index.m3u8
+    # with rolling in-memory segments made once per broadcast for any number of HLS viewers
+    hlsoutput = False
+    # HLS output target segment duration (seconds). Segments are cut on video keyframes
+    hlssegmentduration = 4
+    # Number of segments in the HLS output live playlist
+    hlswindow = 5
+    # Broadcast with HLS viewers only is stopped after hlstimeout seconds without HLS requests
+    hlstimeout = 30
+    # LOADASYNC results (infohash, files) cache: play requests for known content skip LOADASYNC.
+    # Cached content info is valid for contentcachettl seconds (0 - cache disabled), the least recently used
+    # entries over contentcachesize are dropped. Cache is saved to contentcachefile ('' - not saved)
+    # every contentcachesaveinterval seconds and on shutdown
+    contentcachettl = 86400
+    contentcachesize = 1000
+    contentcachefile = 'contentinfo.json'
+    contentcachesaveinterval = 300
     use_chunked = True  # Enable HTTP/1.1 chunked transfer encoding for streaming
     fakeuas = ('Mozilla/5.0 IMC plugin Macintosh', )
-    loglevel = logging.DEBUG
+    loglevel = logging.INFO
     logfmt = '%(filename)-20s [LINE:%(lineno)-4s]# %(levelname)-8s [%(asctime)s]  %(message)s'
     logdatefmt='%d.%m %H:%M:%S'
     logfile = None
+    # Per-subsystem log levels {'logger name': level}. Loggers: 'HTTPServer', 'handleRequest', 'AceClient',
+    # 'BroadcastManager', 'Admission' and 'aceclient.<module>' ('aceclient.enginepool', 'aceclient.sessionpool',
+    # 'aceclient.contentcache', 'aceclient.httpapi', 'aceclient.enginestream', 'aceclient.channelgroups'),
+    # e.g. loglevels = {'AceClient': logging.WARNING, 'aceclient': logging.INFO}
+    loglevels = {}
+    # Log records are written to logfile (or console) by a background thread through a queue of logqueuesize
+    # records, so a slow disk doesn't stall streaming (0 - written at once). The oldest records are dropped if it is full
+    logqueuesize = 10000
+    # At most lograteburst identical records every lograteinterval seconds, e.g. a failing engine
+    # repeating the same error (0 - no limit)
+    lograteburst = 0
+    lograteinterval = 60
+    # Write log records as JSON lines
+    logjson = False
 
     @classmethod
     def isFakeRequest(cls, path, params, headers):
@@ -36,15 +36,36 @@ from urllib3.packages.six.moves.BaseHTTPServer import BaseHTTPRequestHandler
 from urllib3.packages.six.moves.urllib.parse import urlparse, unquote
 from urllib3.packages.six.moves import range, map
 from urllib3.packages.six import ensure_binary, ensure_str
-try:
-   from ipaddress import ip_network as IPNetwork, ip_address as IPAddress
-except:
-   from ipaddr import IPNetwork, IPAddress
+from requests.structures import CaseInsensitiveDict
 import aceclient
 from aceclient.clientcounter import ClientCounter
+from aceclient.ringbuffer import SlowClientError
+from aceclient.enginestream import EngineStream, HLSStream
+from aceclient.mpegts import discontinuity
+from aceclient.contentcache import ContentCache
+from aceclient.enginepool import Engine, EnginePool
+from aceclient.channelgroups import ChannelGroups, SourceCollapsed
+from aceclient.admission import AdmissionController
 import aceconfig
 from aceconfig import AceConfig
-from utils import schedule, query_get
+from utils import schedule, query_get, writev
+from firewall import NetworkMatcher
+import logqueue
+from logqueue import lazy
+
+class RequestHeaders(CaseInsensitiveDict):
+    '''
+    Request headers with case-insensitive names. Missing header is None as with HTTPMessage: headers['Host']
+    '''
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def get(self, key, default=None):
+        try: return CaseInsensitiveDict.__getitem__(self, key)
+        except KeyError: return default
+
+    def __contains__(self, key):
+        return key.lower() in self._store
 
 class HTTPHandler(BaseHTTPRequestHandler):
 
@@ -61,21 +82,93 @@ class HTTPHandler(BaseHTTPRequestHandler):
     def log_request(self, code='-', size='-'): pass
         #logger.debug('"%s" %s %s', unquote(self.requestline).decode('utf8'), str(code), str(size))
 
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self._connectionattrs = None
+
+    def handle_one_request(self):
+        '''
+        One request of a keep-alive (or pipelined) connection.
+        Attributes left by the previous request on this connection are dropped, idle connection is closed
+        after httpkeepalivetimeout seconds without a new request.
+        Keep-alive is opt-in: the connection is closed unless the request handler set keepalive
+        (it leaves no greenlets reading the connection behind)
+        '''
+        if self._connectionattrs is None: self._connectionattrs = set(self.__dict__)
+        else:
+           for name in set(self.__dict__) - self._connectionattrs: del self.__dict__[name]
+        self.connection.settimeout(AceConfig.httpkeepalivetimeout)
+        BaseHTTPRequestHandler.handle_one_request(self)
+        if not self.__dict__.get('keepalive'): self.close_connection = True
+
+    def parse_request(self):
+        '''
+        Lean request parser: request line and headers into a case-insensitive dict.
+        HTTP/1.1 connection is kept alive unless client asks to close it, HTTP/1.0 one only if client asks to keep it
+        '''
+        self.command, self.request_version, self.close_connection = None, 'HTTP/0.9', True
+        self.requestline = ensure_str(self.raw_requestline, 'latin-1').rstrip('\r\n')
+        words = self.requestline.split()
+        if len(words) != 3 or not words[2].startswith('HTTP/'):
+           self.wfile.write(b'HTTP/1.1 400 Bad Request\r\nConnection: close\r\nContent-Length: 0\r\n\r\n')
+           return False
+        self.command, self.path, self.request_version = words
+        self.headers = RequestHeaders()
+        for _ in range(100):
+           line = self.rfile.readline(65537)
+           if line in (b'\r\n', b'\n', b''): break
+           name, sep, value = ensure_str(line, 'latin-1').partition(':')
+           if sep: self.headers[name.strip()] = value.strip()
+        else:
+           self.wfile.write(b'HTTP/1.1 431 Request Header Fields Too Large\r\nConnection: close\r\nContent-Length: 0\r\n\r\n')
+           return False
+        self.connection.settimeout(None)
+        connection = self.headers.get('Connection', '').lower()
+        self.close_connection = connection == 'close' if self.request_version == 'HTTP/1.1' else connection != 'keep-alive'
+        return True
+
+    def send_response(self, code, message=None):
+        '''
+        Response status line and headers are collected in one buffer and sent with end_headers()
+        '''
+        self._headers = ['%s %d %s\r\n' % (self.protocol_version, code, message or self.responses.get(code, ('',))[0]),
+                         'Server: %s\r\n' % self.server_version,
+                         'Date: %s\r\n' % self.date_time_string()]
+        self._framed = code in (204, 304) or self.command == 'HEAD'
+
+    def send_header(self, keyword, value):
+        self._headers.append('%s: %s\r\n' % (keyword, value))
+        keyword = keyword.lower()
+        if keyword == 'connection':
+           self.close_connection = value.lower() == 'close'
+        elif keyword in ('content-length', 'transfer-encoding'):
+           self._framed = True
+
+    def end_headers(self):
+        # Response without length can be finished only by closing the connection
+        if not self._framed and not self.close_connection:
+           self.send_header('Connection', 'close')
+        self._headers.append('\r\n')
+        self.wfile.write(ensure_binary(''.join(self._headers), 'latin-1'))
+        self._headers = []
+
     def finish(self):
-        logging.debug('[{clientip}]: Disconnected'.format(**self.__dict__))
+        logger.debug('[%s]: Disconnected', self.__dict__.get('clientip', self.client_address[0]))
         self.connection.shutdown(SHUT_RDWR)
-        if self.handlerGreenlet:
+        if getattr(self, 'handlerGreenlet', None):
            self.handlerGreenlet.kill()
 
-    def send_error(self, errorcode=500, logmsg='Dying with error', loglevel=logging.ERROR):
+    def send_error(self, errorcode=500, logmsg='Dying with error', loglevel=logging.ERROR, headers=None):
         '''
         Close connection with error
+        headers: additional response headers {'header': value}
         '''
         try:
            self.send_response(errorcode)
            self.send_header('Content-Type', 'text/plain')
            self.send_header('Content-Length', len(logmsg))
            self.send_header('Connection', 'Close')
+           for (k,v) in (headers or {}).items(): self.send_header(k, v)
            self.end_headers()
            self.wfile.write(ensure_binary(logmsg))
         finally:
@@ -94,17 +187,14 @@ class HTTPHandler(BaseHTTPRequestHandler):
         '''
         self.handlerGreenlet = gevent.getcurrent() # Current greenlet
         self.clientip = self.headers.get('X-Forwarded-For', self.address_string()) # Connected client IP address
-        logging.info(unquote('[{clientip}]: {command} {request_version} request for: {path}'.format(**self.__dict__)))
-        logging.debug('[%s]: Request headers: %s' % (self.clientip, dict(self.headers)))
+        logger.info('[%s]: %s %s request for: %s', self.clientip, self.command, self.request_version, lazy(unquote, self.path))
+        logger.debug('[%s]: Request headers: %s', self.clientip, lazy(dict, self.headers))
 
-        logging.debug('[%s]: Step 1 - checking firewall' % self.clientip)
         if AceConfig.firewall and not checkFirewall(self.clientip):
            self.send_error(401, '[{clientip}]: Dropping connection due to firewall rules'.format(**self.__dict__), logging.ERROR)
 
-        logging.debug('[%s]: Step 2 - parsing path' % self.clientip)
         self.path, _, self.query = self.path.partition('?')
         self.path = self.path.rstrip('/')
-        logging.debug('[%s]: Step 3 - path=%s, checking if fake' % (self.clientip, self.path))
         # Pretend to work fine with Fake or HEAD request.
         try:
             is_fake = AceConfig.isFakeRequest(self.path, self.query, self.headers)
@@ -112,63 +202,60 @@ class HTTPHandler(BaseHTTPRequestHandler):
             logging.error('[%s]: Error in isFakeRequest: %s' % (self.clientip, repr(e)))
             logging.error(traceback.format_exc())
             is_fake = False
-        logging.debug('[%s]: path=%s, is_fake=%s, command=%s' % (self.clientip, self.path, is_fake, self.command))
         if self.command == 'HEAD' or is_fake:
            # Return 200 and exit
            if self.command != 'HEAD': self.command = 'FAKE'
-           logging.debug('[{clientip}]: {command} request: send headers and close the connection'.format(**self.__dict__))
+           logger.debug('[%s]: %s request: send headers and close the connection', self.clientip, self.command)
            self.send_response(200)
            self.send_header('Content-Type', 'video/mp2t')
            self.send_header('Connection', 'Close')
            self.end_headers()
            return
 
+        self.splittedpath = self.path.split('/')
+        self.reqtype = self.splittedpath[1].lower() if len(self.splittedpath) > 1 else ''
+        # Request type and handler from the route table built at startup
+        reqtype, handler = AceProxy.routes.get(self.reqtype, (None, None))
         try:
-           self.splittedpath = self.path.split('/')
-           self.reqtype = self.splittedpath[1].lower()
-
-           if self.reqtype in AceProxy.pluginshandlers:
-               logging.debug('[%s]: Calling plugin handler for reqtype: %s' % (self.clientip, self.reqtype))
-               original_reqtype = self.reqtype
-               try:
-                   AceProxy.pluginshandlers[self.reqtype].handle(self) # If request should be handled by plugin
-               except Exception as plugin_error:
-                   logging.error('[%s]: Plugin handler error: %s' % (self.clientip, repr(plugin_error)))
-                   logging.error(traceback.format_exc())
-                   raise
-
-               # If plugin changed reqtype, continue processing with new reqtype
-               if hasattr(self, 'reqtype') and self.reqtype != original_reqtype:
-                   logging.debug('[%s]: Plugin redirected to reqtype: %s' % (self.clientip, self.reqtype))
-                   raise IndexError()  # Continue processing with new reqtype
-               else:
-                   logging.debug('[%s]: Plugin handler completed successfully' % self.clientip)
-                   return  # Plugin handled the request successfully
-           else:
-               # Not a plugin, move to core request handling
-               raise KeyError(self.reqtype)
-
-        except (IndexError, KeyError):
-           self.reqtype = {'torrent': 'url', 'pid': 'content_id'}.get(self.reqtype, self.reqtype) # For backward compatibility
-           if self.reqtype in {'content_id', 'url', 'infohash', 'direct_url', 'data', 'efile_url'}:
-              # Limit on the number of connected clients
-              if 0 < AceConfig.maxconns <= len(AceProxy.clientcounter.getAllClientsList()):
-                 self.send_error(403, "[{clientip}]: Maximum client connections reached, can't serve request".format(**self.__dict__), logging.ERROR)
-              # Check if third path parameter is exists /{reqtype}/{reqtype_value}/.../.../video.mpg
-              #                                                                           |_________|
-              # And if it ends with regular video extension
-              if not self.splittedpath[-1].endswith(('.avi', '.flv', '.m2ts', '.mkv', '.mpeg', '.mpeg4', '.mpegts',
-                                                     '.mpg4', '.mp4', '.mpg', '.mov', '.mpv', '.qt', '.ts', '.wmv')):
-                    self.send_error(501, '[{clientip}]: request seems like valid but no valid video extension was provided'.format(**self.__dict__), logging.ERROR)
-              else:
-                 self.handleRequest()
-           elif self.reqtype not in AceProxy.pluginshandlers:
+           if handler is None:
               self.send_error(400, '[{clientip}]: Bad Request'.format(**self.__dict__), logging.WARNING)  # 400 Bad Request
-
+           self.reqtype = reqtype
+           handler(self)
         except Exception as e:
            logging.error('Unexpected exception: %s' % repr(e))
            logging.error(traceback.format_exc())
 
+    def handlePlugin(self):
+        '''
+        Plugin request handler. Plugin may redirect the request to a core handler (e.g. playlist channel to /content_id/...)
+        by setting reqtype and path of the request
+        '''
+        plugin = self.reqtype
+        self.keepalive = True
+        try:
+           AceProxy.pluginshandlers[plugin].handle(self)
+        except Exception as plugin_error:
+           logging.error('[%s]: Plugin handler error: %s' % (self.clientip, repr(plugin_error)))
+           raise
+        if self.reqtype != plugin:
+           reqtype, handler = AceProxy.routes.get(self.reqtype, (None, None))
+           if handler is None or handler == HTTPHandler.handlePlugin:
+              self.send_error(400, '[{clientip}]: Bad Request'.format(**self.__dict__), logging.WARNING)
+           logger.debug('[%s]: Plugin %s redirected to %s', self.clientip, plugin, reqtype)
+           self.reqtype = reqtype
+           handler(self)
+
+    def handleContent(self):
+        '''
+        Content request: /{reqtype}/{reqtype_value}/.../.../video.{ext}
+        '''
+        # Check if third path parameter is exists /{reqtype}/{reqtype_value}/.../.../video.mpg
+        #                                                                           |_________|
+        # And if it ends with regular video extension (.m3u8 is redirected to the built-in HLS output)
+        if not self.splittedpath[-1].endswith(AceProxy.videoextensions):
+           self.send_error(501, '[{clientip}]: request seems like valid but no valid video extension was provided'.format(**self.__dict__), logging.ERROR)
+        self.handleRequest()
+
     def handleRequest(self):
         '''
         Main request handler path: /{reqtype}/{reqtype_value}/{file_indexes}/{developer_id}/{affiliate_id}/{zone_id}/{stream_id}/{fname}.{ext}
@@ -177,71 +264,65 @@ class HTTPHandler(BaseHTTPRequestHandler):
         # Make handler parameters dict
         self.__dict__.update({}.fromkeys(aceclient.acemessages.AceConst.START_PARAMS, '0')) # [file_indexes, developer_id, affiliate_id, zone_id, stream_id]
         self.__dict__.update({k:v for (k,v) in [(aceclient.acemessages.AceConst.START_PARAMS[i-3], self.splittedpath[i] if self.splittedpath[i].isdigit() else '0') for i in range(3, len(self.splittedpath))]})
+        self.__dict__.update(aceParams())
         self.__dict__.update({self.reqtype: unquote(self.splittedpath[2]), # {reqtype: reqtype_value}
-                              'ace': AceConfig.ace,
-                              'acesex': AceConfig.acesex,
-                              'aceage': AceConfig.aceage,
-                              'acekey': AceConfig.acekey,
-                              'connect_timeout': AceConfig.aceconntimeout,
-                              'result_timeout': AceConfig.aceresulttimeout,
-                              'videoseekback': AceConfig.videoseekback,
-                              'videotimeout': AceConfig.videotimeout,
-                              'stream_type': ' '.join(['{}={}'.format(k,v) for k,v in AceConfig.acestreamtype.items()]), # request http or hls from AceEngine
                               'sessionID': self.handlerGreenlet.name[self.handlerGreenlet.name.rfind('-') + 1:], # Greenlet.minimal_ident A small, unique non-negative integer
                               'connectionTime': gevent.time.time(),
                               'clientDetail': None,
                               'channelIcon': self.__dict__.get('channelIcon', 'http://static.acestream.net/sites/acestream/img/ACE-logo.png'),
                              })
         # End parameters dict
+        ticket = None
         try:
            transcoder = gevent.event.AsyncResult()
            out = self.wfile
+           self.keepalive = False  # Watchdog below reads the connection until it is closed
            gevent.spawn(wrap_errors(gevent.socket.error, self.rfile.read)).link(lambda x: self.handlerGreenlet.kill()) # Client disconection watchdog
 
-           # Step 1: Get content info (infohash) using temporary idleAce
-           # This idleAce is NOT used for streaming, only for metadata
+           # Step 1: Get content info (infohash) using temporary idleAce of the least loaded engine
            try:
-              if not AceProxy.clientcounter.idleAce:
-                 logger.debug('Create temporary connection with AceStream on {ace[aceHostIP]}:{ace[aceAPIport]} for CONTENTINFO'.format(**self.__dict__))
-                 AceProxy.clientcounter.idleAce = aceclient.AceClient(self.__dict__)
-                 AceProxy.clientcounter.idleAce.GetAUTH()
-
               if self.reqtype not in ('direct_url', 'efile_url'):
                  # Use idleAce to get content info (infohash, files, etc)
-                 self.__dict__.update(AceProxy.clientcounter.idleAce.GetCONTENTINFO(self.__dict__))
+                 self.__dict__.update(getContentInfo(self.__dict__))
                  self.channelName = ensure_str(self.__dict__.get('channelName', next(iter([ x[0] for x in self.files if x[1] == int(self.file_indexes) ]), 'NoNameChannel')))
               else:
                  # For direct URLs, generate infohash from path
                  self.channelName = ensure_str(self.__dict__.get('channelName', 'NoNameChannel'))
                  self.infohash = requests.auth.hashlib.sha1(ensure_binary(self.path)).hexdigest()
 
-              logger.debug('[{clientip}]: Content info retrieved - infohash: {infohash}, channel: {channelName}'.format(**self.__dict__))
+              logger.debug('[%s]: Content info retrieved - infohash: %s, channel: %s', self.clientip, self.infohash, self.channelName)
 
            except Exception as e:
-              if AceProxy.clientcounter.idleAce:
-                 try:
-                    AceProxy.clientcounter.idleAce._read.kill()
-                 except: pass
+              # idleAce is shared by concurrent lookups - it is recreated only when its connection is closed
               self.send_error(404, '%s' % repr(e), logging.ERROR)
 
-           # Step 2: Check concurrent broadcast limit BEFORE creating new broadcast
-           if 0 < AceConfig.maxconcurrentchannels <= AceProxy.clientcounter.getBroadcastCount():
-              # Only enforce limit if this would be a NEW broadcast (infohash not already active)
-              if self.infohash not in AceProxy.clientcounter.broadcasts:
-                 logger.warning('[{clientip}]: Maximum concurrent broadcasts reached ({}/{}), rejecting new channel request'.format(
-                    AceProxy.clientcounter.getBroadcastCount(), AceConfig.maxconcurrentchannels, **self.__dict__))
-                 self.send_error(503, "[{clientip}]: Maximum concurrent channels reached ({} active), try again later".format(
-                    AceProxy.clientcounter.getBroadcastCount()), logging.WARNING)
+           # Step 2: Admission - wait for a free client slot (maxconns) and, for a NEW broadcast, channel slot (maxconcurrentchannels)
+           # Viewers of pinned and running channels go first, then clients with fewer streams
+           if AceProxy.pinned & pinnedKeys(self.__dict__): priority = AdmissionController.PINNED
+           elif self.infohash in AceProxy.clientcounter.broadcasts: priority = AdmissionController.RUNNING
+           else: priority = AdmissionController.NEW
+           share = len([c for c in AceProxy.clientcounter.getAllClientsList() if c.clientip == self.clientip])
+           ticket = AceProxy.admission.admit(self.clientip, priority, share,
+                                             lambda clients, broadcasts: slotAvailable(self.infohash, clients, broadcasts, priority == AdmissionController.PINNED))
+           if ticket is None:
+              retry = {'Retry-After': AceConfig.admissionretryafter}
+              if 0 < AceConfig.maxconns <= len(AceProxy.clientcounter.getAllClientsList()) + AceProxy.admission.pending[0]:
+                 self.send_error(403, "[{clientip}]: Maximum client connections reached, can't serve request".format(**self.__dict__), logging.WARNING, retry)
+              self.send_error(503, "[{clientip}]: Maximum concurrent channels reached ({} active), try again later".format(
+                 AceProxy.clientcounter.getBroadcastCount(), **self.__dict__), logging.WARNING, retry)
 
            # Step 3: Get or create broadcast for this channel
            # BroadcastManager will reuse existing broadcast or create new one
-           # This assigns self.ace and self.q via addClient() later
-           logger.debug('[{clientip}]: Getting/Creating broadcast for infohash: {infohash}'.format(**self.__dict__))
+           # This assigns self.ace, self.broadcast and self.cursor via addClient() later
+           logger.debug('[%s]: Getting/Creating broadcast for infohash: %s', self.clientip, self.infohash)
 
            self.ext = self.__dict__.get('ext', self.channelName[self.channelName.rfind('.') + 1:])
            if self.ext == self.channelName: self.ext = query_get(self.query, 'ext', 'ts')
            mimetype = mimetypes.guess_type('{channelName}.{ext}'.format(**self.__dict__))[0]
            try:
+              if AceConfig.hlsoutput and self.splittedpath[-1].endswith('.m3u8'):
+                 self.redirectHLS()
+                 return
               # If &fmt transcode key present in request
               fmt = query_get(self.query, 'fmt')
               if fmt:
@@ -261,13 +342,16 @@ class HTTPHandler(BaseHTTPRequestHandler):
                  elif AceConfig.osplatform == 'Windows':
                     logger.error('[{channelName}]: Not applicable in Windnows OS. Transcoding to [{clientip}] not started!'.format(**self.__dict__))
 
-              if AceProxy.clientcounter.addClient(self) == 1:
-                 # Create broadcast if it does not exist yet
-                 gevent.spawn(StreamReader, self.ace.GetBroadcastStartParams(self.__dict__)).link(lambda x: logger.debug('[{channelName}]: Broadcast destroyed. Last client disconnected'.format(**self.__dict__)))
-                 logger.debug('[{channelName}]: Broadcast created'.format(**self.__dict__))
+              AceProxy.clientcounter.addClient(self, broadcastParams(self.__dict__))
+              AceProxy.admission.done(ticket)
+              # Start broadcast if it is not started yet (lingering or pinned broadcast keeps its stream reader).
+              # Only one request sends START, all the others wait for its result or error
+              if startBroadcast(self.broadcast, broadcastParams(self.__dict__)):
+                 logger.debug('[%s]: Broadcast created', self.channelName)
               else:
-                 logger.debug('[{channelName}]: Broadcast already exists'.format(**self.__dict__))
-              logger.info('[{channelName}]: Streaming to [{clientip}] started'.format(**self.__dict__))
+                 logger.debug('[%s]: Broadcast already exists', self.channelName)
+              self.broadcast.started.get()
+              logger.info('[%s]: Streaming to [%s] started', self.channelName, self.clientip)
               # Sending videostream headers to client
               response_use_chunked = False if (transcoder.value or self.request_version == 'HTTP/1.0') else AceConfig.use_chunked
               drop_headers = []
@@ -285,31 +369,228 @@ class HTTPHandler(BaseHTTPRequestHandler):
 
               response_headers = [(k,v) for (k,v) in proxy_headers.items() if k not in drop_headers]
               self.send_response(200)
-              logger.debug('[%s]: Sending HTTPAceProxy headers: %s' % (self.clientip, dict(response_headers)))
-              gevent.joinall([gevent.spawn(self.send_header, k,v) for (k,v) in response_headers])
+              logger.debug('[%s]: Sending HTTPAceProxy headers: %s', self.clientip, lazy(dict, response_headers))
+              for (k,v) in response_headers: self.send_header(k,v)
               self.end_headers()
               # write data to client while it is alive
-              for chunk in self.q:
-                 out.write(b'%X\r\n%s\r\n' % (len(chunk),chunk) if response_use_chunked else chunk)
+              if response_use_chunked:
+                 # Chunk size, shared chunk and trailer in one vectored write - chunk data is never copied
+                 for chunk in self.cursor:
+                    writev(self.connection, (b'%X\r\n' % len(chunk), chunk, b'\r\n'))
+              else:
+                 for chunk in self.cursor:
+                    out.write(chunk)
 
            except aceclient.AceException as e:
-              _ = AceProxy.pool.map(lambda x: x.send_error(500, repr(e), logging.ERROR), AceProxy.clientcounter.getClientsList(self.infohash))
+              self.send_error(500, repr(e), logging.ERROR)
+           except SlowClientError as e:
+              logger.warning('[{clientip}]: {} - disconnecting slow client'.format(e, **self.__dict__))
+              self.close_connection = True
            except  gevent.socket.error: pass # Client disconnected
 
-        except gevent.GreenletExit:
-           AceProxy.clientcounter.idleAce._read.kill()
+        except gevent.GreenletExit: pass # Client disconnected
 
         finally:
+           AceProxy.admission.done(ticket)
            AceProxy.clientcounter.deleteClient(self)
-           logger.info('[{channelName}]: Streaming to [{clientip}] finished'.format(**self.__dict__))
+           AceProxy.admission.notify()
+           logger.info('[%s]: Streaming to [%s] finished', self.channelName, self.clientip)
            if transcoder.value:
               try: transcoder.value.kill(); logger.info('[{channelName}]: Transcoding to [{clientip}] stoped'.format(**self.__dict__))
               except: pass
 
+    def redirectHLS(self):
+        '''
+        Start broadcast with HLS output and redirect client to its live playlist.
+        HLS viewers are not broadcast clients - the broadcast lingers while they poll the playlist
+        '''
+        broadcast = AceProxy.clientcounter.getOrCreateBroadcast(self.infohash, broadcastParams(self.__dict__))
+        try:
+           startBroadcast(broadcast, broadcastParams(self.__dict__))
+           broadcast.started.get()
+           broadcast.startHLS()
+        finally:
+           if broadcast is AceProxy.clientcounter.broadcasts.get(self.infohash):
+              AceProxy.clientcounter.releaseBroadcast(self.infohash)
+        logging.info('[{channelName}]: HLS output for [{clientip}] started'.format(**self.__dict__))
+        # Disconnect watchdog of this request still reads the connection - the playlist request comes on a new one
+        self.send_response(302)
+        self.send_header('Location', '/hls/%s/index.m3u8' % self.infohash)
+        self.send_header('Content-Length', 0)
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+    def handleHLS(self):
+        '''
+        HLS output request handler path: /hls/{infohash}/index.m3u8 or /hls/{infohash}/{media_sequence}.ts
+        Playlist and segments are served from memory of the broadcast segmenter
+        '''
+        self.keepalive = True
+        broadcast = AceProxy.clientcounter.broadcasts.get(self.splittedpath[2]) if len(self.splittedpath) == 4 else None
+        if not broadcast or not broadcast.hls:
+           self.send_error(404, '[{clientip}]: HLS output not found for {path}'.format(**self.__dict__), logging.WARNING)
+        name = self.splittedpath[3]
+        if name == 'index.m3u8':
+           content, mimetype = broadcast.hls.getPlaylist(AceConfig.videotimeout), 'application/vnd.apple.mpegurl'
+        else:
+           content = broadcast.hls.getSegment(int(name[:-3])) if name.endswith('.ts') and name[:-3].isdigit() else None
+           mimetype = 'video/MP2T'
+        if content is None:
+           self.send_error(404, '[{clientip}]: HLS segment not found for {path}'.format(**self.__dict__), logging.WARNING)
+        self.send_response(200)
+        self.send_header('Content-Type', mimetype)
+        self.send_header('Content-Length', len(content))
+        self.send_header('Cache-Control', 'no-cache' if name == 'index.m3u8' else 'max-age=%d' % AceConfig.hlstimeout)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(content)
+
 class AceProxy(object):
     '''
     Inter-class interaction class
     '''
+
+# Core request types: {path prefix: request type} (torrent and pid for backward compatibility)
+CONTENT_REQTYPES = {'content_id': 'content_id', 'url': 'url', 'infohash': 'infohash', 'direct_url': 'direct_url',
+                    'data': 'data', 'efile_url': 'efile_url', 'torrent': 'url', 'pid': 'content_id'}
+# Request parameters the engine needs to START a broadcast: content, START_PARAMS and requested stream type
+START_KEYS = tuple(aceclient.acemessages.AceConst.START) + aceclient.acemessages.AceConst.START_PARAMS + ('stream_type',)
+VIDEO_EXTENSIONS = ('.avi', '.flv', '.m2ts', '.mkv', '.mpeg', '.mpeg4', '.mpegts', '.mpg4', '.mp4', '.mpg', '.mov', '.mpv', '.qt', '.ts', '.wmv')
+
+def buildRoutes():
+    '''
+    Route table {first path segment: (reqtype, HTTPHandler method)} for do_GET.
+    Built at startup after plugins are loaded and on configuration reload. Plugins take precedence over core routes
+    '''
+    routes = dict((prefix, (reqtype, HTTPHandler.handleContent)) for (prefix, reqtype) in CONTENT_REQTYPES.items())
+    if AceConfig.hlsoutput: routes['hls'] = ('hls', HTTPHandler.handleHLS)
+    routes.update((name, (name, HTTPHandler.handlePlugin)) for name in AceProxy.pluginshandlers)
+    AceProxy.routes = routes
+    AceProxy.videoextensions = VIDEO_EXTENSIONS + (('.m3u8',) if AceConfig.hlsoutput else ())
+
+def aceParams():
+    '''
+    AceClient and Broadcast parameters from configuration
+    '''
+    return {'ace': AceConfig.ace,
+            'acebackend': AceConfig.acebackend,
+            'acesex': AceConfig.acesex,
+            'aceage': AceConfig.aceage,
+            'acekey': AceConfig.acekey,
+            'connect_timeout': AceConfig.aceconntimeout,
+            'result_timeout': AceConfig.aceresulttimeout,
+            'videoseekback': AceConfig.videoseekback,
+            'videotimeout': AceConfig.videotimeout,
+            'videobuffersize': AceConfig.videobuffersize,
+            'slowclientpolicy': AceConfig.slowclientpolicy,
+            'slowclientmaxlag': AceConfig.slowclientmaxlag,
+            'videofaststart': AceConfig.videofaststart,
+            'broadcastlinger': AceConfig.broadcastlinger,
+            'hlssegmentduration': AceConfig.hlssegmentduration,
+            'hlswindow': AceConfig.hlswindow,
+            'hlstimeout': AceConfig.hlstimeout,
+            'stream_type': ' '.join(['{}={}'.format(k,v) for k,v in AceConfig.acestreamtype.items()]), # request http or hls from AceEngine
+           }
+
+def getContentInfo(params):
+    '''
+    Get content info (infohash, files, etc) from cache or with the temporary idleAce of an engine
+    This idleAce is NOT used for streaming, only for metadata
+    '''
+    key = ContentCache.key(params)
+    contentinfo = AceProxy.contentinfo.get(key)
+    if contentinfo:
+       logger.debug('Content info for %s found in cache', key)
+       return contentinfo
+    contentinfo = AceProxy.clientcounter.getContentInfo(params)
+    AceProxy.contentinfo.put(key, contentinfo)
+    return contentinfo
+
+def broadcastParams(params):
+    '''
+    Broadcast and START parameters of the request without the request handler state (connection, buffers etc.)
+    that would be kept by the broadcast after the client is gone
+    '''
+    return dict((k, params[k]) for k in tuple(aceParams()) + START_KEYS if k in params)
+
+def startBroadcast(broadcast, params):
+    '''
+    Spawn stream reader which sends START to AceEngine and fills the broadcast buffer.
+    START result (or error) is available to all clients with broadcast.started
+    Returns: False if the broadcast is already started
+    '''
+    if broadcast.streamreader: return False
+    broadcast.streamreader = gevent.spawn(StreamReader, broadcast, params)
+    broadcast.streamreader.link(lambda x: logger.debug('[Broadcast %s]: Stream reader finished', broadcast.infohash[:8]))
+    if broadcast.pinned:
+       # Pinned channel is restarted as soon as its stream ends (after acestartuptimeout if it died right after the start)
+       started = gevent.time.time()
+       broadcast.streamreader.link(lambda x: gevent.spawn_later(0 if gevent.time.time() - started > AceConfig.acestartuptimeout else AceConfig.acestartuptimeout,
+                                                                pinBroadcast, broadcast.pinned))
+    return True
+
+def pinBroadcast(channel):
+    '''
+    Start (or restart) always-on broadcast for pinned channel.
+    channel: 'content_id:<id>', 'infohash:<infohash>' or just '<content_id>'
+    '''
+    if channel not in AceProxy.pinned: return None
+    broadcast = AceProxy.clientcounter.getPinnedBroadcast(channel)
+    if broadcast and broadcast.streamreader and not broadcast.buffer.closed: return broadcast
+    if broadcast: AceProxy.clientcounter.removeBroadcast(broadcast.infohash)
+    if 0 < AceConfig.maxpinned <= AceProxy.clientcounter.getPinnedCount():
+       logger.warning("Can't start pinned channel %s: maximum of %d pinned channels reached", channel, AceConfig.maxpinned)
+       return None
+    reqtype, _, value = channel.rpartition(':')
+    params = aceParams()
+    params.update({}.fromkeys(aceclient.acemessages.AceConst.START_PARAMS, '0'))
+    params.update({reqtype or 'content_id': value, 'sessionID': 'pinned', 'connectionTime': gevent.time.time()})
+    try:
+       params.update(getContentInfo(params))
+       broadcast = AceProxy.clientcounter.getOrCreateBroadcast(params['infohash'], params)
+       broadcast.pinned = channel
+       startBroadcast(broadcast, params)
+       broadcast.started.get()
+       logger.info('Pinned channel %s started', channel)
+       return broadcast
+    except Exception as e:
+       logger.error("Can't start pinned channel %s: %r", channel, e)
+
+def pinnedKeys(params):
+    '''
+    Pinned channel items which match request parameters
+    '''
+    keys = set('%s:%s' % (k, params[k]) for k in ('content_id', 'infohash') if params.get(k))
+    if params.get('content_id'): keys.add(params['content_id'])
+    return keys
+
+def slotAvailable(infohash, clients=0, broadcasts=0, pinned=False):
+    '''
+    Free client slot (maxconns) and, unless the broadcast of infohash is running or pinned, free channel slot (maxconcurrentchannels).
+    clients, broadcasts: slots taken by admitted requests which are not attached to their broadcasts yet.
+    A broadcast nobody watches (lingering) gives its channel slot away
+    '''
+    if 0 < AceConfig.maxconns <= len(AceProxy.clientcounter.getAllClientsList()) + clients: return False
+    if pinned or infohash in AceProxy.clientcounter.broadcasts or AceConfig.maxconcurrentchannels <= 0: return True
+    if AceProxy.clientcounter.getBroadcastCount() + broadcasts < AceConfig.maxconcurrentchannels: return True
+    return AceProxy.clientcounter.evictLingering() and slotAvailable(infohash, clients, broadcasts)
+
+def unpinBroadcast(channel):
+    '''
+    Make pinned broadcast ordinary - it stops when nobody watches it
+    '''
+    AceProxy.pinned.discard(channel)
+    broadcast = AceProxy.clientcounter.getPinnedBroadcast(channel)
+    if broadcast:
+       broadcast.pinned = None
+       AceProxy.clientcounter.releaseBroadcast(broadcast.infohash)
+
+def checkPinned():
+    '''
+    Pinned channels watchdog. Starts pinned broadcasts which are not running
+    '''
+    for channel in list(AceProxy.pinned): pinBroadcast(channel)
 # taken from http://stackoverflow.com/questions/2699907/dropping-root-permissions-in-python
 def drop_privileges(uid_name='nobody', gid_name='nogroup'):
     try: import pwd, grp
@@ -335,46 +616,167 @@ def drop_privileges(uid_name='nobody', gid_name='nogroup'):
        logger.info('Changed permissions to: %s: %i, %s, %i' % (uid_name, running_uid, gid_name, running_gid))
     return value
 
-def StreamReader(params):
+def StreamReader(broadcast, params):
     '''
-    params: dict([url=] [file_index=] [infohash= ] [ad=1 [interruptable=1]] [stream=1] [pos=position] [bitrate=] [length=])
+    broadcast: Broadcast instance whose shared buffer is filled with video chunks
+    params: START request parameters. Replaced by START response from AceEngine:
+            dict([url=] [file_index=] [infohash= ] [ad=1 [interruptable=1]] [stream=1] [pos=position] [bitrate=] [length=])
+
+    Stalled live stream (no data for streamstalltimeout seconds, stream error or end of stream) is recovered
+    while clients stay attached to the broadcast buffer: the stream url is reconnected first, then START is sent again,
+    then START is sent with a fresh AceClient. New data is joined with TS discontinuity marker.
+    Channel with alternative sources (ChannelGroups) switches to the next source when the current one fails all
+    recovery attempts or its peers/download speed collapse. With racestart the first racestart sources are started
+    in parallel and the broadcast keeps the one which delivers TS data first.
+    The clients get an error only after streamrecoveries failed attempts in a row of the last source
     '''
 
-    def checkBroadcast():
-        if not params['broadcastclients']:
-           params['broadcast'].kill()
-        return params['broadcast'].started
-
-    def write_chunk(client, chunk, timeout=15.0):
-        try: client.q.put(chunk, timeout=timeout)
-        except gevent.queue.Full:
-           client.send_error(500, '[%s]: does not read data until %s sec' % (client.clientip, timeout), logging.ERROR)
-
-    def StreamWriter(url):
-        for chunk in s.get(url, timeout=(5, AceConfig.videotimeout), stream=True).iter_content(chunk_size=1048576):
-           _ = params['chunkpool'].map(lambda client: write_chunk(client, chunk), params['broadcastclients'])
-
+    def StreamWriter(stream, join=False, failover=False):
+        # The engine reader never waits for clients - every client reads the shared buffer with its own cursor
+        # Broadcast lifecycle (including linger) is handled by BroadcastManager which stops this reader
+        chunks, received, collapsed, checked = iter(stream), False, None, 0
+        try:
+           while 1:
+              timeout = AceConfig.streamstalltimeout if received else AceConfig.videotimeout
+              with gevent.Timeout(timeout, aceclient.AceException('No video data for %s sec' % timeout)):
+                 chunk = next(chunks, None)
+              if chunk is None: return
+              if join and not received: broadcast.buffer.put(discontinuity(broadcast.buffer.scanner))
+              broadcast.buffer.put(chunk)
+              received = True
+              # Source health from the engine status snapshot (once a second, only if there is a source to switch to)
+              if failover and gevent.time.time() - checked >= 1:
+                 checked = gevent.time.time()
+                 collapsed = (collapsed or checked) if Collapsed() else None
+                 if collapsed and checked - collapsed >= AceConfig.failovergrace:
+                    raise SourceCollapsed('Source collapsed for %s sec' % AceConfig.failovergrace)
+        finally:
+           if hasattr(chunks, 'close'): chunks.close()
+
+    def Collapsed():
+        status = broadcast.aceClient.GetSTATUS()
+        if status.get('status') != 'dl': return False
+        try: return int(status.get('peers', 0)) < AceConfig.failoverminpeers or int(status.get('speed_down', 0)) < AceConfig.failoverminspeed
+        except ValueError: return False
+
+    def Start(client=None, startsource=None):
+        params = (client or broadcast.aceClient).GetBroadcastStartParams(startsource or source)
+        ace = broadcast.engine.ace if broadcast.engine else AceConfig.ace
+        params.update({'url': urlparse(unquote(params['url']))._replace(netloc='{aceHostIP}:{aceHTTPport}'.format(**ace)).geturl(),
+                       'broadcastclients': broadcast.clients,
+                      })
+        return params
+
+    def Stream(url):
+        if url.endswith('.m3u8'): # AceEngine return link for HLS stream
+           return HLSStream(url, AceConfig.videotimeout, AceConfig.hlsprefetch)
+        else: #AceStream return link for HTTP stream
+           if AceConfig.streamlowlatency: flushsize, flushtime = AceConfig.streamlowlatencyflushsize, AceConfig.streamlowlatencyflushtime
+           else: flushsize, flushtime = AceConfig.streamflushsize, AceConfig.streamflushtime
+           return EngineStream(url, AceConfig.videotimeout, AceConfig.aceconntimeout, flushsize, flushtime)
+
+    def Source(alternative):
+        # START params of the alternative source of the channel
+        return dict([(k, startparams[k]) for k in aceclient.acemessages.AceConst.START_PARAMS + ('stream_type',) if k in startparams],
+                    file_indexes='0', **alternative)
+
+    def Primed(chunk, chunks):
+        # Stream that already delivered its first chunk
+        try:
+           yield chunk
+           for chunk in chunks: yield chunk
+        finally: chunks.close()
+
+    def Racer(client, startsource):
+        params = Start(client, startsource)
+        chunks = iter(Stream(params['url']))
+        with gevent.Timeout(AceConfig.videotimeout, aceclient.AceException('No video data for %s sec' % AceConfig.videotimeout)):
+           chunk = next(chunks, None)
+        if not chunk or chunk[:1] != b'\x47':
+           chunks.close()
+           raise aceclient.AceException('No valid TS data')
+        # Started engine stream is kept to be closed if the source loses the race (Primed may be never started)
+        return params, Primed(chunk, chunks), chunks
+
+    def Race(sources):
+        '''
+        START sources in parallel, each on its own engine session, and keep the first one that delivers TS data.
+        The other sources are stopped and their sessions go back to the engine
+        :return (winner index, START params, stream)
+        '''
+        clients, racers = [broadcast.aceClient], []
+        try:
+           for _ in sources[1:]:
+              try: clients.append(broadcast.spareClient())
+              except aceclient.AceException as e:
+                 logger.warning('[Broadcast %s]: No engine session for race start: %r', broadcast.infohash[:8], e)
+                 break
+           racers = [gevent.spawn(Racer, client, startsource) for (client, startsource) in zip(clients, sources)]
+           for racer in gevent.iwait(racers):
+              if racer.successful():
+                 winner = racers.index(racer)
+                 broadcast.setClient(clients[winner])
+                 logger.info('[Broadcast %s]: Race start won by source %d of %d', broadcast.infohash[:8], winner + 1, len(racers))
+                 return (winner,) + racer.value[:2]
+           raise racers[0].exception
+        finally:
+           gevent.killall(racers)
+           for racer in racers:
+              if isinstance(racer.value, tuple) and clients[racers.index(racer)] is not broadcast.aceClient: racer.value[2].close()
+           for client in clients:
+              if client is not broadcast.aceClient: broadcast.releaseClient(client)
+
+    startparams = source = dict((k, params[k]) for k in START_KEYS if k in params)
+    # START params of the other sources of the same channel from playlist plugins
+    alternatives = [Source(x) for x in AceProxy.channelgroups.alternatives(startparams)] if AceConfig.sourcefailover or AceConfig.racestart > 1 else []
+    raced = []  # Stream of the race start winner
     try:
-       params.update({'url': urlparse(unquote(params['url']))._replace(netloc='{aceHostIP}:{aceHTTPport}'.format(**AceConfig.ace)).geturl(),
-                      'broadcast': gevent.getcurrent(),
-                      'broadcastclients': AceProxy.clientcounter.getClientsList(params['infohash']),
-                      'chunkpool': Pool(),
-                     })
-       with requests.session() as s:
-          if params['url'].endswith('.m3u8'): # AceEngine return link for HLS stream
-             import m3u8; urls = []
-             while checkBroadcast():
-                for url in m3u8.load(params['url']).segments.uri:
-                   if url in urls: continue
-                   else:
-                      StreamWriter(url)
-                      urls.append(url)
-                      if len(urls) > 50: urls.pop(0)
-
-          else: StreamWriter(params['url']) #AceStream return link for HTTP stream
+       if AceConfig.racestart > 1 and alternatives:
+          winner, params, stream = Race([startparams] + alternatives[:AceConfig.racestart - 1])
+          if winner:
+             # Requested source stays the first candidate to fail over to
+             source = alternatives.pop(winner - 1)
+             alternatives.insert(0, startparams)
+          raced.append(stream)
+       else: params = Start()
+       if not AceConfig.sourcefailover: del alternatives[:]
+       broadcast.started.set(params)
+       attempt, failover = 0, False
+       while 1:
+          offset = broadcast.buffer.offset
+          try:
+             if failover: # Send START for the next source of the channel
+                failover, source = False, alternatives.pop(0)
+                broadcast.aceClient.StopBroadcast()
+                params = Start()
+             elif attempt == 2: # Send START again
+                broadcast.aceClient.StopBroadcast()
+                params = Start()
+             elif attempt > 2: # Send START with a fresh AceClient
+                broadcast.renewClient()
+                params = Start()
+             StreamWriter(raced.pop() if raced else Stream(params['url']), offset > 0, bool(alternatives))
+             if params.get('stream') != '1': break # VOD is over
+             error = aceclient.AceException('Live stream ended')
+          except gevent.GreenletExit: raise
+          except Exception as e: error = e
+          attempt = 1 if broadcast.buffer.offset > offset else attempt + 1
+          if alternatives and (isinstance(error, SourceCollapsed) or attempt > AceConfig.streamrecoveries):
+             failover, attempt = True, 1
+             logger.warning('[Broadcast %s]: Source failed (%r), failover to %s', broadcast.infohash[:8], error, lazy(ChannelGroups.current, alternatives[0]))
+             continue
+          if attempt > AceConfig.streamrecoveries: raise error
+          logger.warning('[Broadcast %s]: Stream stalled (%r), recovery attempt %d', broadcast.infohash[:8], error, attempt)
+          gevent.sleep(min(attempt - 1, 5))
     except (TypeError, gevent.GreenletExit): pass
     except Exception as err:
-       _ = AceProxy.pool.map(lambda x: x.send_error(500, repr(err), logging.ERROR), params['broadcastclients'])
+       if not broadcast.started.ready():
+          AceProxy.contentinfo.discard(ContentCache.key(startparams)) # Cached content info may be stale
+          broadcast.started.set_exception(err)
+       else: _ = AceProxy.pool.map(lambda x: x.send_error(500, repr(err), logging.ERROR), list(broadcast.clients))
+    finally:
+       if not broadcast.started.ready(): broadcast.started.set_exception(aceclient.AceException('Broadcast stopped before START'))
+       broadcast.buffer.close()
 
 # Spawning procedures
 def spawnAce(cmd ='' if AceConfig.osplatform == 'Windows' else AceConfig.acecmd.split(), delay=AceConfig.acestartuptimeout):
@@ -395,21 +797,38 @@ def spawnAce(cmd ='' if AceConfig.osplatform == 'Windows' else AceConfig.acecmd.
 
 def checkAce():
     if AceConfig.acespawn and not isRunning(AceProxy.ace):
-       if AceProxy.clientcounter.idleAce: AceProxy.clientcounter.idleAce.ShutdownAce()
+       AceProxy.clientcounter.engines.close()
        if hasattr(AceProxy, 'ace'): del AceProxy.ace
        if spawnAce():
           logger.error('Ace Stream died, respawned with pid %s' % AceProxy.ace.pid)
           # refresh the acestream.port file for Windows only after full loading...
           if AceConfig.osplatform == 'Windows': detectPort()
           else: gevent.sleep(AceConfig.acestartuptimeout)
-          # Creating ClientCounter
-          AceProxy.clientcounter = ClientCounter()
+          # Creating ClientCounter (sessions of the dead engine are replaced by the engines health check)
+          AceProxy.clientcounter = ClientCounter(AceProxy.clientcounter.engines)
        else:
           logger.error("Can't spawn Ace Stream!")
 
+def buildFirewall():
+    '''
+    Compile firewall netranges (at startup and on configuration reload)
+    '''
+    try: AceProxy.firewall = NetworkMatcher(AceConfig.firewallnetranges)
+    except ValueError as e:
+       AceProxy.firewall = None
+       logger.error('Check firewall netranges settings ! %s' % e)
+
+def buildAdmission():
+    '''
+    Admission queue limits (at startup and on configuration reload). Waiting requests stay in the queue
+    '''
+    if not hasattr(AceProxy, 'admission'): AceProxy.admission = AdmissionController()
+    AceProxy.admission.queuesize, AceProxy.admission.perip, AceProxy.admission.wait = \
+       AceConfig.admissionqueue, AceConfig.admissionperip, AceConfig.admissionwait
+
 def checkFirewall(clientip):
-    try: clientinrange = any([IPAddress(clientip) in IPNetwork(i) for i in AceConfig.firewallnetranges])
-    except: logger.error('Check firewall netranges settings !'); return False
+    try: clientinrange = clientip in AceProxy.firewall
+    except (TypeError, ValueError): logger.error('Check firewall netranges settings !'); return False
     return not ((AceConfig.firewallblacklistmode and clientinrange) or (not AceConfig.firewallblacklistmode and not clientinrange))
 
 def detectPort():
@@ -448,8 +867,7 @@ def clean_proc():
     # Trying to close all spawned processes gracefully
     _ = AceProxy.pool.map(lambda x: x.send_error(500, '[{clientip}]: abnormal termination!'.format(**x.__dict__), logging.ERROR), AceProxy.clientcounter.getAllClientsList())
     if AceConfig.acespawn and isRunning(AceProxy.ace):
-       if AceProxy.clientcounter.idleAce:
-          AceProxy.clientcounter.idleAce.ShutdownAce(); gevent.sleep(0.5)
+       AceProxy.clientcounter.engines.close(); gevent.sleep(0.5)
        AceProxy.ace.terminate()
        if AceConfig.osplatform == 'Windows' and os.path.isfile(AceProxy.acedir + '\\acestream.port'):
           try:
@@ -462,6 +880,7 @@ def clean_proc():
 def shutdown():
     logging.info('Received CTL+C, shutting down Ace Stream HTTP Proxy server.....')
     clean_proc()
+    AceProxy.contentinfo.save()
     AceProxy.server.close()
     logger.info('Bye Bye .....')
     sys.exit()
@@ -478,6 +897,11 @@ def _reloadconfig(signum=None, frame=None):
     from aceconfig import AceConfig
     #### Initial settings for AceHTTPproxy host IP
     if AceConfig.httphost == 'auto': AceConfig.httphost = get_ip_address()
+    logqueue.setup(AceConfig.loglevel, AceConfig.logfile, AceConfig.logfmt, AceConfig.logdatefmt, AceConfig.logjson, AceConfig.loglevels,
+                   AceConfig.logqueuesize, AceConfig.lograteburst, AceConfig.lograteinterval)
+    buildRoutes()
+    buildFirewall()
+    buildAdmission()
     logger.info('Ace Stream HTTP Proxy config reloaded.....')
 
 def get_ip_address():
@@ -500,7 +924,6 @@ def check_compatibility(gevent_version, psutil_version):
     # psutil >= 5.3.0
     assert (major, minor, patch) >= (5, 3, 0)
 
-logging.basicConfig(level=AceConfig.loglevel, filename=AceConfig.logfile, format=AceConfig.logfmt, datefmt=AceConfig.logdatefmt)
 logger = logging.getLogger('HTTPServer')
 
 ### Initial settings for devnull
@@ -510,128 +933,154 @@ if AceConfig.acespawn or AceConfig.transcodecmd:
    except ImportError:
       DEVNULL = open(os.devnull, 'wb')  # Py2
 
-logger.info('Ace Stream HTTP Proxy server on Python %s starting .....' % sys.version.split()[0])
-logger.debug('Using: %s OS with gevent %s, psutil %s' % (AceConfig.osplatform, gevent.__version__, psutil.__version__))
-
-try: check_compatibility(gevent.__version__, psutil.__version__)
-except (AssertionError, ValueError):
-   logger.error("gevent %s or psutil %s doesn't match a supported version!" % (gevent.__version__, psutil.__version__))
-   logger.error('Update python dependencies to required: gevent >= 1.3.3, psutil >= 5.3.0')
-   logger.info('Bye Bye .....')
-   sys.exit()
-
-#### Initial settings for AceHTTPproxy host IP
-if AceConfig.httphost == 'auto':
-   AceConfig.httphost = get_ip_address()
-   logger.debug('Ace Stream HTTP Proxy server IP: %s autodetected' % AceConfig.httphost)
-
-# Check whether we can bind to the defined port safely
-if AceConfig.osplatform != 'Windows' and os.getuid() != 0 and AceConfig.httpport <= 1024:
-   logger.error('Cannot bind to port %s without root privileges' % AceConfig.httpport)
-   sys.exit(1)
-
-# Dropping root privileges if needed
-if AceConfig.osplatform != 'Windows' and AceConfig.aceproxyuser and os.getuid() == 0:
-   if drop_privileges(AceConfig.aceproxyuser):
-      logger.info('Dropped privileges to user %s' % AceConfig.aceproxyuser)
-   else:
-      logger.error('Cannot drop privileges to user %s' % AceConfig.aceproxyuser)
-      sys.exit(1)
-
-# Creating ClientCounter
-AceProxy.pool = Pool()
-AceProxy.clientcounter = ClientCounter()
-#### AceEngine startup
-AceProxy.ace = findProcess('ace_engine.exe' if AceConfig.osplatform == 'Windows' else os.path.basename(AceConfig.acecmd))
-if not AceProxy.ace and AceConfig.acespawn:
-   if spawnAce():
-      logger.info('Local AceStream engine spawned with pid %s' % AceProxy.ace.pid)
-      schedule(AceConfig.acestartuptimeout, checkAce) # Start AceEngine alive watchdog
-elif AceProxy.ace:
-   AceProxy.ace = psutil.Process(AceProxy.ace)
-   logger.info('Local AceStream engine found with pid %s' % AceProxy.ace.pid)
-
-# If AceEngine started (found) localy
-if AceProxy.ace:
-   AceConfig.ace['aceHostIP'] = '127.0.0.1'
-   # Refreshes the acestream.port file for OS Windows.....
-   if AceConfig.osplatform == 'Windows': detectPort()
-   else: gevent.sleep(AceConfig.acestartuptimeout)
-else:
-   url = 'http://{aceHostIP}:{aceHTTPport}/webui/api/service'.format(**AceConfig.ace)
-   params = {'method': 'get_version', 'format': 'json', 'callback': 'mycallback'}
-   try:
-      with requests.get(url, params=params, timeout=5) as r:
-         ace_version = r.json()['result']['version']
-         AceProxy.ace_version = ace_version
-         logger.info('Remote AceStream engine ver.{} will be used on {aceHostIP}:{aceAPIport}'.format(ace_version, **AceConfig.ace))
-   except:
-      AceProxy.ace_version = None
-      logger.error('AceStream not found!')
-
-# Loading plugins
-# Trying to change dir (would fail in freezed state)
-try: os.chdir(ROOT_DIR)
-except: pass
-sys.path.insert(0, 'plugins')
-logger.info('Load Ace Stream HTTP Proxy plugins .....')
+def main():
+    '''
+    Start Ace Stream HTTP Proxy server
+    '''
+    logqueue.setup(AceConfig.loglevel, AceConfig.logfile, AceConfig.logfmt, AceConfig.logdatefmt, AceConfig.logjson, AceConfig.loglevels,
+                   AceConfig.logqueuesize, AceConfig.lograteburst, AceConfig.lograteinterval)
+    logger.info('Ace Stream HTTP Proxy server on Python %s starting .....' % sys.version.split()[0])
+    logger.debug('Using: %s OS with gevent %s, psutil %s' % (AceConfig.osplatform, gevent.__version__, psutil.__version__))
+
+    try: check_compatibility(gevent.__version__, psutil.__version__)
+    except (AssertionError, ValueError):
+       logger.error("gevent %s or psutil %s doesn't match a supported version!" % (gevent.__version__, psutil.__version__))
+       logger.error('Update python dependencies to required: gevent >= 1.3.3, psutil >= 5.3.0')
+       logger.info('Bye Bye .....')
+       sys.exit()
 
-def add_handler(name):
-    # isidentifier() Py2/Py3 compatible
-    if requests.utils.re.match(r'^\w+$', name, requests.utils.re.UNICODE) and not name[0].isdigit() and name not in sys.modules:
-       try:
-          plugname = name.split('_')[0].capitalize()
-          plugininstance = getattr(__import__(name), plugname)(AceConfig, AceProxy)
-       except Exception as err:
-          logger.error("Can't load plugin %s: %s" % (plugname, repr(err)))
-          return {}
+    #### Initial settings for AceHTTPproxy host IP
+    if AceConfig.httphost == 'auto':
+       AceConfig.httphost = get_ip_address()
+       logger.debug('Ace Stream HTTP Proxy server IP: %s autodetected' % AceConfig.httphost)
+
+    # Check whether we can bind to the defined port safely
+    if AceConfig.osplatform != 'Windows' and os.getuid() != 0 and AceConfig.httpport <= 1024:
+       logger.error('Cannot bind to port %s without root privileges' % AceConfig.httpport)
+       sys.exit(1)
+
+    # Dropping root privileges if needed
+    if AceConfig.osplatform != 'Windows' and AceConfig.aceproxyuser and os.getuid() == 0:
+       if drop_privileges(AceConfig.aceproxyuser):
+          logger.info('Dropped privileges to user %s' % AceConfig.aceproxyuser)
        else:
-          logger.debug('[%-15.15s]: Plugin loaded' % plugname)
-          return {j:plugininstance for j in plugininstance.handlers}
-    return {}
-
-# Creating dict of handlers
-pluginslist_all = glob.glob('plugins/*_plugin.py')
-logger.debug('Found plugin files: %s' % pluginslist_all)
-pluginslist = [os.path.splitext(os.path.basename(x))[0] for x in pluginslist_all]
-
-# Filter plugins based on ENABLED_PLUGINS environment variable
-all_plugins = {p.split('_')[0].lower(): p for p in pluginslist}
-if AceConfig.enabled_plugins != 'all':
-    enabled_names = [p.strip() for p in AceConfig.enabled_plugins.split(',') if p.strip()]
-    # Check for invalid plugin names
-    invalid_plugins = [p for p in enabled_names if p not in all_plugins]
-    if invalid_plugins:
-        logger.warning('Invalid plugin names in ENABLED_PLUGINS (will be ignored): %s' % ', '.join(invalid_plugins))
-        logger.warning('Available plugins: %s' % ', '.join(sorted(all_plugins.keys())))
-    # Filter to only enabled plugins
-    filtered_pluginslist = [all_plugins[p] for p in enabled_names if p in all_plugins]
-    disabled_plugins = [p for p in all_plugins.keys() if p not in enabled_names]
-    if disabled_plugins:
-        logger.info('Disabled plugins: %s' % ', '.join(sorted(disabled_plugins)))
-    if filtered_pluginslist:
-        logger.info('Enabled plugins: %s' % ', '.join(sorted(enabled_names)))
+          logger.error('Cannot drop privileges to user %s' % AceConfig.aceproxyuser)
+          sys.exit(1)
+
+    # Creating ClientCounter
+    AceProxy.pool = Pool()
+    # AceEngines (AceConfig.ace if no aceengines configured) with their idle sessions and session pools
+    AceProxy.clientcounter = ClientCounter(EnginePool([Engine(dict(aceParams(), ace=e), e.get('weight', 1), AceConfig.acesessionpool)
+                                                       for e in (AceConfig.aceengines or (AceConfig.ace,))]))
+    AceProxy.contentinfo = ContentCache(os.path.join(ROOT_DIR, AceConfig.contentcachefile) if AceConfig.contentcachefile else None,
+                                        AceConfig.contentcachettl, AceConfig.contentcachesize)
+    AceProxy.pinned = set(AceConfig.pinnedchannels)
+    buildFirewall()
+    buildAdmission()
+    AceProxy.pinBroadcast, AceProxy.unpinBroadcast = pinBroadcast, unpinBroadcast
+    # Equivalent channel sources registered by playlist plugins
+    AceProxy.channelgroups = ChannelGroups()
+    #### AceEngine startup
+    AceProxy.ace = findProcess('ace_engine.exe' if AceConfig.osplatform == 'Windows' else os.path.basename(AceConfig.acecmd))
+    if not AceProxy.ace and AceConfig.acespawn:
+       if spawnAce():
+          logger.info('Local AceStream engine spawned with pid %s' % AceProxy.ace.pid)
+          schedule(AceConfig.acestartuptimeout, checkAce) # Start AceEngine alive watchdog
+    elif AceProxy.ace:
+       AceProxy.ace = psutil.Process(AceProxy.ace)
+       logger.info('Local AceStream engine found with pid %s' % AceProxy.ace.pid)
+
+    # If AceEngine started (found) localy
+    if AceProxy.ace:
+       AceConfig.ace['aceHostIP'] = '127.0.0.1'
+       # Refreshes the acestream.port file for OS Windows.....
+       if AceConfig.osplatform == 'Windows': detectPort()
+       else: gevent.sleep(AceConfig.acestartuptimeout)
+    else:
+       url = 'http://{aceHostIP}:{aceHTTPport}/webui/api/service'.format(**AceConfig.ace)
+       params = {'method': 'get_version', 'format': 'json', 'callback': 'mycallback'}
+       try:
+          with requests.get(url, params=params, timeout=5) as r:
+             ace_version = r.json()['result']['version']
+             AceProxy.ace_version = ace_version
+             logger.info('Remote AceStream engine ver.{} will be used on {aceHostIP}:{aceAPIport}'.format(ace_version, **AceConfig.ace))
+       except:
+          AceProxy.ace_version = None
+          logger.error('AceStream not found!')
+
+    # Loading plugins
+    # Trying to change dir (would fail in freezed state)
+    try: os.chdir(ROOT_DIR)
+    except: pass
+    sys.path.insert(0, 'plugins')
+    logger.info('Load Ace Stream HTTP Proxy plugins .....')
+
+    def add_handler(name):
+        # isidentifier() Py2/Py3 compatible
+        if requests.utils.re.match(r'^\w+$', name, requests.utils.re.UNICODE) and not name[0].isdigit() and name not in sys.modules:
+           try:
+              plugname = name.split('_')[0].capitalize()
+              plugininstance = getattr(__import__(name), plugname)(AceConfig, AceProxy)
+           except Exception as err:
+              logger.error("Can't load plugin %s: %s" % (plugname, repr(err)))
+              return {}
+           else:
+              logger.debug('[%-15.15s]: Plugin loaded' % plugname)
+              return {j:plugininstance for j in plugininstance.handlers}
+        return {}
+
+    # Creating dict of handlers
+    pluginslist_all = glob.glob('plugins/*_plugin.py')
+    logger.debug('Found plugin files: %s' % pluginslist_all)
+    pluginslist = [os.path.splitext(os.path.basename(x))[0] for x in pluginslist_all]
+
+    # Filter plugins based on ENABLED_PLUGINS environment variable
+    all_plugins = {p.split('_')[0].lower(): p for p in pluginslist}
+    if AceConfig.enabled_plugins != 'all':
+        enabled_names = [p.strip() for p in AceConfig.enabled_plugins.split(',') if p.strip()]
+        # Check for invalid plugin names
+        invalid_plugins = [p for p in enabled_names if p not in all_plugins]
+        if invalid_plugins:
+            logger.warning('Invalid plugin names in ENABLED_PLUGINS (will be ignored): %s' % ', '.join(invalid_plugins))
+            logger.warning('Available plugins: %s' % ', '.join(sorted(all_plugins.keys())))
+        # Filter to only enabled plugins
+        filtered_pluginslist = [all_plugins[p] for p in enabled_names if p in all_plugins]
+        disabled_plugins = [p for p in all_plugins.keys() if p not in enabled_names]
+        if disabled_plugins:
+            logger.info('Disabled plugins: %s' % ', '.join(sorted(disabled_plugins)))
+        if filtered_pluginslist:
+            logger.info('Enabled plugins: %s' % ', '.join(sorted(enabled_names)))
+        else:
+            logger.warning('No valid plugins enabled!')
+        pluginslist = filtered_pluginslist
     else:
-        logger.warning('No valid plugins enabled!')
-    pluginslist = filtered_pluginslist
-else:
-    logger.info('All plugins enabled: %s' % ', '.join(sorted(all_plugins.keys())))
-
-AceProxy.pluginshandlers = {}
-for plugin in pluginslist:
-    handlers = add_handler(plugin)
-    if handlers:
-        AceProxy.pluginshandlers.update(handlers)
-logger.debug('Registered plugin handlers: %s' % list(AceProxy.pluginshandlers.keys()))
-# Server setup
-AceProxy.server = StreamServer((AceConfig.httphost, AceConfig.httpport), handle=HTTPHandler, spawn=AceProxy.pool)
-# Capture  signal handlers (SIGINT, SIGQUIT etc.)
-gevent.signal_handler(signal.SIGTERM, shutdown)
-gevent.signal_handler(signal.SIGINT, shutdown)
-if AceConfig.osplatform != 'Windows':
-   gevent.signal_handler(signal.SIGQUIT, shutdown)
-   gevent.signal_handler(signal.SIGHUP, _reloadconfig)
-AceProxy.server.start()
-logger.info('Server started at {}:{} Use <Ctrl-C> to stop'.format(AceConfig.httphost, AceConfig.httpport))
-# Start complite. Wating for requests
-gevent.wait()
+        logger.info('All plugins enabled: %s' % ', '.join(sorted(all_plugins.keys())))
+
+    AceProxy.pluginshandlers = {}
+    for plugin in pluginslist:
+        handlers = add_handler(plugin)
+        if handlers:
+            AceProxy.pluginshandlers.update(handlers)
+    logger.debug('Registered plugin handlers: %s' % list(AceProxy.pluginshandlers.keys()))
+    buildRoutes()
+    # Server setup
+    AceProxy.server = StreamServer((AceConfig.httphost, AceConfig.httpport), handle=HTTPHandler, spawn=AceProxy.pool)
+    # Capture  signal handlers (SIGINT, SIGQUIT etc.)
+    gevent.signal_handler(signal.SIGTERM, shutdown)
+    gevent.signal_handler(signal.SIGINT, shutdown)
+    if AceConfig.osplatform != 'Windows':
+       gevent.signal_handler(signal.SIGQUIT, shutdown)
+       gevent.signal_handler(signal.SIGHUP, _reloadconfig)
+    AceProxy.server.start()
+    logger.info('Server started at {}:{} Use <Ctrl-C> to stop'.format(AceConfig.httphost, AceConfig.httpport))
+    # Start always-on pinned channels and their watchdog
+    schedule(AceConfig.pinnedcheckinterval, checkPinned)
+    # AceEngines health check, warm up and check their session pools
+    schedule(AceConfig.acesessioncheckinterval, AceProxy.clientcounter.engines.check)
+    # Periodically save content info cache
+    schedule(AceConfig.contentcachesaveinterval, AceProxy.contentinfo.save)
+    # Start complite. Wating for requests
+    gevent.wait()
+
+if __name__ == '__main__':
+   main()
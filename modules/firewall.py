@@ -0,0 +1,53 @@
+'''
+Firewall network ranges matcher
+'''
+__author__ = 'Dorik1972'
+
+from bisect import bisect_right
+from collections import OrderedDict
+from urllib3.packages.six import ensure_text
+try:
+   from ipaddress import ip_network as IPNetwork, ip_address as IPAddress
+except:
+   from ipaddr import IPNetwork, IPAddress
+
+class NetworkMatcher(object):
+    '''
+    IPv4/IPv6 network ranges compiled once into sorted disjoint intervals of integer addresses per address family.
+    Membership test is a binary search, recent client addresses are answered from a LRU cache.
+    Raises ValueError for an invalid network range
+    >>> '192.168.1.10' in NetworkMatcher(('127.0.0.1', '192.168.0.0/16'))
+    True
+    '''
+    def __init__(self, netranges, cachesize=4096):
+        intervals = {4: [], 6: []}
+        for netrange in netranges:
+           net = IPNetwork(ensure_text(netrange))
+           if hasattr(net, 'network_address'): intervals[net.version].append((int(net.network_address), int(net.broadcast_address)))
+           else: intervals[net.version].append((int(net.network), int(net.broadcast)))  # ipaddr
+        self._ranges = {}  # {version: (interval starts, interval ends)}
+        for version, items in intervals.items():
+           merged = []
+           for first, last in sorted(items):
+              if merged and first <= merged[-1][1] + 1: merged[-1][1] = max(merged[-1][1], last)
+              else: merged.append([first, last])
+           self._ranges[version] = ([x[0] for x in merged], [x[1] for x in merged])
+        self._cache = OrderedDict()
+        self._cachesize = cachesize
+
+    def __len__(self):
+        return sum(len(starts) for (starts, _) in self._ranges.values())
+
+    def __contains__(self, ip):
+        found = self._cache.pop(ip, None)
+        if found is None: found = self._match(ip)
+        self._cache[ip] = found
+        if len(self._cache) > self._cachesize: self._cache.popitem(last=False)
+        return found
+
+    def _match(self, ip):
+        address = IPAddress(ensure_text(ip))
+        address = getattr(address, 'ipv4_mapped', None) or address  # ::ffff:a.b.c.d is IPv4 client
+        starts, ends = self._ranges[address.version]
+        i = bisect_right(starts, int(address)) - 1
+        return i >= 0 and int(address) <= ends[i]
@@ -0,0 +1,135 @@
+'''
+Non-blocking logging for gevent: records are queued by the greenlets and written
+to the log file (or console) by a real OS thread, so a slow disk never stalls the event loop
+'''
+__author__ = 'Dorik1972'
+
+import logging, json
+from collections import deque
+from gevent.monkey import get_original
+
+try: start_new_thread = get_original('_thread', 'start_new_thread')  # Py3
+except ImportError: start_new_thread = get_original('thread', 'start_new_thread')  # Py2
+sleep = get_original('time', 'sleep')
+# Target handlers are used by the background thread - their locks must be real thread locks, not gevent ones
+try: RLock = get_original('_thread', 'RLock')
+except (ImportError, AttributeError): RLock = None
+
+class lazy(object):
+    '''
+    Log argument evaluated only if the record is written: logger.debug('%s', lazy(dict, headers))
+    '''
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        self.func, self.args = func, args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+class QueueHandler(logging.Handler):
+    '''
+    Puts records into a bounded queue drained by a background OS thread into the target handlers.
+    The oldest records are dropped if the queue is full, the number of dropped records is logged
+    '''
+    def __init__(self, handlers, maxsize=10000, interval=0.1):
+        logging.Handler.__init__(self)
+        self.handlers = handlers
+        for handler in handlers:
+           if RLock: handler.lock = RLock()
+        self.queue = deque(maxlen=maxsize)
+        self.interval = interval
+        self.dropped = 0
+        self._running = True
+        start_new_thread(self._drain, ())
+
+    def emit(self, record):
+        if len(self.queue) == self.queue.maxlen: self.dropped += 1
+        self.queue.append(record)
+
+    def flush(self):
+        while self.queue:
+           record = self.queue.popleft()
+           for handler in self.handlers:
+              if record.levelno >= handler.level and handler.filter(record):
+                 try: handler.emit(record)
+                 except Exception: handler.handleError(record)
+        if self.dropped:
+           dropped, self.dropped = self.dropped, 0
+           self.queue.append(logging.makeLogRecord({'name': 'logqueue', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                                                    'msg': 'Log queue is full, %d records dropped' % dropped}))
+        for handler in self.handlers: handler.flush()
+
+    def close(self):
+        self._running = False
+        self.flush()
+        for handler in self.handlers: handler.close()
+        logging.Handler.close(self)
+
+    def _drain(self):
+        while self._running:
+           if self.queue: self.flush()
+           sleep(self.interval)
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Passes at most burst records with the same logger, level and message every interval seconds.
+    The number of suppressed records is added to the first record passed in the next interval
+    '''
+    def __init__(self, burst=20, interval=60):
+        logging.Filter.__init__(self)
+        self.burst, self.interval = burst, interval
+        self._windows = {}  # {(name, levelno, message): [window start, count, suppressed]}
+
+    def filter(self, record):
+        # Formatted message: distinct lines of one template (e.g. access log of different requests) are not limited
+        key = (record.name, record.levelno, record.getMessage())
+        window = self._windows.get(key)
+        if window is None or record.created - window[0] >= self.interval:
+           if len(self._windows) > 10000: self._windows.clear()
+           suppressed = window[2] if window else 0
+           window = self._windows[key] = [record.created, 0, 0]
+           if suppressed: record.msg = '%s [%d identical messages suppressed]' % (record.msg, suppressed)
+        window[1] += 1
+        if window[1] > self.burst:
+           window[2] += 1
+           return False
+        return True
+
+class JSONFormatter(logging.Formatter):
+    '''
+    One JSON object per line
+    '''
+    def format(self, record):
+        entry = {'time': self.formatTime(record, self.datefmt),
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'file': record.filename,
+                 'line': record.lineno,
+                 'message': record.getMessage()}
+        if record.exc_info: entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+def setup(level=logging.INFO, filename=None, fmt=None, datefmt=None, jsonformat=False, levels=None,
+          queuesize=10000, burst=0, interval=60):
+    '''
+    Configure root logger (instead of logging.basicConfig):
+    level, filename, fmt, datefmt - as for logging.basicConfig
+    jsonformat - write records as JSON lines
+    levels - per-subsystem levels {'logger name': level}
+    queuesize - records written by a background thread through a queue of this size (0 - written synchronously)
+    burst, interval - at most burst records with the same message every interval seconds (0 - no limit)
+    '''
+    handler = logging.FileHandler(filename) if filename else logging.StreamHandler()
+    handler.setFormatter(JSONFormatter(fmt, datefmt) if jsonformat else logging.Formatter(fmt, datefmt))
+    # Rate limit compares formatted messages - it is applied by the target handler in the background thread
+    if burst and interval: handler.addFilter(RateLimitFilter(burst, interval))
+    if queuesize: handler = QueueHandler([handler], queuesize)
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+       root.removeHandler(h)
+       h.close()
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, sublevel in (levels or {}).items(): logging.getLogger(name).setLevel(sublevel)
+    return handler
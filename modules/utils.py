@@ -13,6 +13,21 @@ def schedule(delay, func, *args, **kw_args):
     spawn_later(0, func, *args, **kw_args)
     spawn_later(delay, schedule, delay, func, *args, **kw_args)
 
+def writev(sock, buffers):
+    '''
+    Send all buffers with vectored socket writes (sendmsg) without joining them.
+    Falls back to one sendall per buffer where sendmsg is not available
+    '''
+    if not hasattr(sock, 'sendmsg'):
+       for buf in buffers: sock.sendall(buf)
+       return
+    buffers = [memoryview(buf) for buf in buffers]
+    while buffers:
+       sent = sock.sendmsg(buffers)
+       while buffers and sent >= buffers[0].nbytes:
+          sent -= buffers.pop(0).nbytes
+       if sent: buffers[0] = buffers[0][sent:]
+
 def query_get(query, key, default=''):
     '''
     Helper for getting values from a pre-parsed query string
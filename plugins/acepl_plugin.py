@@ -26,6 +26,7 @@ class Acepl(object):
         self.picons = self.channels = self.playlist = self.etag = None
         self.playlisttime = time.time()
         self.headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+        self.channelgroups = AceProxy.channelgroups
         # Parse playlist on startup
         self.Playlistparser()
         # Schedule periodic updates if configured
@@ -124,6 +125,7 @@ class Acepl(object):
                        continue
 
                  self.etag = '"' + m.hexdigest() + '"'
+                 self.channelgroups.register(self.__class__.__name__, self.channels)
                  logging.info('[%s]: plugin playlist generated with %d channels (%d filtered by availability/categories)' %
                              (self.__class__.__name__, channels_added, channels_filtered))
 
@@ -177,7 +179,6 @@ class Acepl(object):
         elif self.etag == connection.headers.get('If-None-Match'):
            logging.debug('[%s]: ETag matches. Return 304 to [%s]' % (self.__class__.__name__, connection.clientip))
            connection.send_response(304)
-           connection.send_header('Connection', 'close')
            connection.end_headers()
            return
 
@@ -196,7 +197,7 @@ class Acepl(object):
               return
            # Use proper Content-Type for M3U8
            content_type = 'audio/mpegurl; charset=utf-8'
-           response_headers = {'Content-Type': content_type, 'Connection': 'close', 'Access-Control-Allow-Origin': '*'}
+           response_headers = {'Content-Type': content_type, 'Access-Control-Allow-Origin': '*'}
            try:
               h = connection.headers.get('Accept-Encoding').split(',')[0]
               compress_method = { 'zlib': zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS),
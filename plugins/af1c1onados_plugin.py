@@ -85,6 +85,7 @@ class Af1c1onados(object):
             
             self.etag = '"' + m.hexdigest() + '"'
             self.playlisttime = time.time()
+            self.AceProxy.channelgroups.register(self.__class__.__name__, self.channels)
             self.logger.info('Playlist updated: %d channels in %d groups' % (len(self.channels), len(groups)))
             return True
             
@@ -130,7 +131,6 @@ class Af1c1onados(object):
         # Handle ETag
         elif self.etag == connection.headers.get('If-None-Match'):
             connection.send_response(304)
-            connection.send_header('Connection', 'close')
             connection.end_headers()
             return
 
@@ -146,7 +146,6 @@ class Af1c1onados(object):
                 
                 response_headers = {
                     'Content-Type': 'audio/mpegurl; charset=utf-8',
-                    'Connection': 'close',
                     'Access-Control-Allow-Origin': '*',
                     'Content-Length': len(exported)
                 }
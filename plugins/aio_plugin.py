@@ -103,7 +103,6 @@ class Aio(object):
             connection.send_response(200)
             connection.send_header('Content-Type', 'audio/mpegurl; charset=utf-8')
             connection.send_header('Content-Length', len(exported))
-            connection.send_header('Connection', 'close')
             connection.end_headers()
             connection.wfile.write(exported)
             
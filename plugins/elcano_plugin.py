@@ -24,6 +24,7 @@ class Elcano(object):
         self.picons = self.channels = self.playlist = self.etag = None
         self.playlisttime = time.time()
         self.headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+        self.channelgroups = AceProxy.channelgroups
         # Parse playlist on startup
         self.Playlistparser()
         # Schedule periodic updates if configured
@@ -39,6 +40,7 @@ class Elcano(object):
            temp_playlist = PlaylistGenerator(m3uchanneltemplate=config.m3uchanneltemplate)
            temp_picons = {}
            temp_channels = {}
+           temp_tvgids = {}
            m = requests.auth.hashlib.md5()
            has_new_content = False
 
@@ -134,6 +136,7 @@ class Elcano(object):
                                              itemdict['tvg'] = unique_name
                                          temp_channels[unique_name] = url
                                          temp_picons[unique_name] = itemdict.get('logo', '')
+                                         temp_tvgids[unique_name] = itemdict['tvgid']
                                          itemdict['url'] = quote(ensure_str(unique_name), '')
                                          temp_playlist.addItem(itemdict)
                                          m.update(ensure_binary(unique_name))
@@ -155,6 +158,7 @@ class Elcano(object):
                self.playlist = temp_playlist
                self.picons = temp_picons
                self.channels = temp_channels
+               self.channelgroups.register(self.__class__.__name__, self.channels, temp_tvgids)
                self.etag = '"' + m.hexdigest() + '"'
                self.headers['If-Modified-Since'] = time.strftime('%a, %d %b %Y %H:%M:%S %Z', time.gmtime())
                logging.info('[%s]: Unified playlist generated with %d total channels from %d sources' % (self.__class__.__name__, len(self.channels), len(config.urls)))
@@ -208,7 +212,6 @@ class Elcano(object):
         elif self.etag == connection.headers.get('If-None-Match'):
            logging.debug('[%s]: ETag matches. Return 304 to [%s]' % (self.__class__.__name__, connection.clientip))
            connection.send_response(304)
-           connection.send_header('Connection', 'close')
            connection.end_headers()
            return
 
@@ -227,7 +230,7 @@ class Elcano(object):
               return
            # Use proper Content-Type for M3U8
            content_type = 'audio/mpegurl; charset=utf-8'
-           response_headers = {'Content-Type': content_type, 'Connection': 'close', 'Access-Control-Allow-Origin': '*'}
+           response_headers = {'Content-Type': content_type, 'Access-Control-Allow-Origin': '*'}
            try:
               h = connection.headers.get('Accept-Encoding').split(',')[0]
               compress_method = { 'zlib': zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS),
@@ -186,6 +186,7 @@ class Misterchire(object):
             self.playlist = temp_playlist
             self.picons = temp_picons
             self.channels = temp_channels
+            self.AceProxy.channelgroups.register(self.__class__.__name__, self.channels)
             self.etag = '"' + m.hexdigest() + '"'
             self.playlisttime = time.time()
 
@@ -247,7 +248,6 @@ class Misterchire(object):
         elif self.etag == connection.headers.get('If-None-Match'):
             logging.debug('[MisterChire]: ETag matches. Return 304 to [%s]' % connection.clientip)
             connection.send_response(304)
-            connection.send_header('Connection', 'close')
             connection.end_headers()
             return
 
@@ -270,7 +270,6 @@ class Misterchire(object):
             content_type = 'audio/mpegurl; charset=utf-8'
             response_headers = {
                 'Content-Type': content_type,
-                'Connection': 'close',
                 'Access-Control-Allow-Origin': '*'
             }
 
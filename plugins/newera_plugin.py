@@ -24,6 +24,7 @@ class Newera(object):
         self.picons = self.channels = self.playlist = self.etag = None
         self.playlisttime = time.time()
         self.headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+        self.channelgroups = AceProxy.channelgroups
         # Parse playlist on startup
         self.Playlistparser()
         # Schedule periodic updates if configured
@@ -41,6 +42,7 @@ class Newera(object):
                  self.playlist = PlaylistGenerator(m3uchanneltemplate=config.m3uchanneltemplate)
                  self.picons = {}
                  self.channels = {}
+                 tvgids = {}
                  m = requests.auth.hashlib.md5()
                  logging.info('[%s]: playlist %s downloaded' % (self.__class__.__name__, config.url))
 
@@ -119,6 +121,7 @@ class Newera(object):
                              name = itemdict['name']
                              self.channels[name] = acestream_url
                              self.picons[name] = itemdict.get('logo', '')
+                             tvgids[name] = itemdict['tvgid']
                              itemdict['url'] = quote(ensure_str(name), '')
 
                              self.playlist.addItem(itemdict)
@@ -127,6 +130,7 @@ class Newera(object):
                     i += 1
 
                  self.etag = '"' + m.hexdigest() + '"'
+                 self.channelgroups.register(self.__class__.__name__, self.channels, tvgids)
                  logging.info('[%s]: plugin playlist generated with %d channels' % (self.__class__.__name__, len(self.channels)))
 
               self.playlisttime = time.time()
@@ -179,7 +183,6 @@ class Newera(object):
         elif self.etag == connection.headers.get('If-None-Match'):
            logging.debug('[%s]: ETag matches. Return 304 to [%s]' % (self.__class__.__name__, connection.clientip))
            connection.send_response(304)
-           connection.send_header('Connection', 'close')
            connection.end_headers()
            return
 
@@ -198,7 +201,7 @@ class Newera(object):
               return
            # Use proper Content-Type for M3U8
            content_type = 'audio/mpegurl; charset=utf-8'
-           response_headers = {'Content-Type': content_type, 'Connection': 'close', 'Access-Control-Allow-Origin': '*'}
+           response_headers = {'Content-Type': content_type, 'Access-Control-Allow-Origin': '*'}
            try:
               h = connection.headers.get('Accept-Encoding').split(',')[0]
               compress_method = { 'zlib': zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS),
@@ -29,8 +29,13 @@ class Stat(object):
     def handle(self, connection):
         path_file_ext = connection.path[connection.path.rfind('.') + 1:]
         if connection.splittedpath[1] == 'stat' and connection.splittedpath.__len__() == 2:
-           if query_get(connection.query, 'action') == 'get_status':
+           action = query_get(connection.query, 'action')
+           if action == 'get_status':
               Stat.SendResponse(200, 'json', ensure_binary(json.dumps(self.getStatusJSON(), ensure_ascii=True)), connection)
+           elif action in ('pin', 'unpin') and not (Stat.ip_is_local(connection.clientip) and Stat.ip_is_local(connection.client_address[0])):
+              connection.send_error(403, '[%s]: Pinned channels can be changed from the local network only' % connection.clientip, logging.WARNING)
+           elif action in ('pin', 'unpin', 'pinned'):
+              Stat.SendResponse(200, 'json', ensure_binary(json.dumps(self.pinChannel(action, query_get(connection.query, 'channel')), ensure_ascii=True)), connection)
            else:
               try: Stat.SendResponse(200, 'html', Stat.getReqFileContent('index.html'), connection)
               except: connection.send_error(404, 'Not Found')
@@ -107,6 +112,29 @@ class Stat(object):
 
         return plugins_info
 
+    def pinChannel(self, action, channel):
+        '''
+        Pinned always-on channels management
+        '''
+        if action in ('pin', 'unpin'):
+           if not channel: return {'status': 'error', 'error': 'channel parameter required'}
+           if action == 'pin':
+              if channel not in self.AceProxy.pinned and 0 < self.AceConfig.maxpinned <= len(self.AceProxy.pinned):
+                 return {'status': 'error', 'error': 'maximum of %d pinned channels reached' % self.AceConfig.maxpinned}
+              self.AceProxy.pinned.add(channel)
+              gevent.spawn(self.AceProxy.pinBroadcast, channel)
+           else: self.AceProxy.unpinBroadcast(channel)
+           self.logger.info('Channel %s %sned' % (channel, action))
+
+        pinned = []
+        for ch in sorted(self.AceProxy.pinned):
+           broadcast = self.AceProxy.clientcounter.getPinnedBroadcast(ch)
+           pinned.append({'channel': ch,
+                          'infohash': broadcast.infohash if broadcast else None,
+                          'running': bool(broadcast and broadcast.streamreader and not broadcast.buffer.closed),
+                          'clients': len(broadcast.clients) if broadcast else 0})
+        return {'status': 'success', 'pinned': pinned}
+
     @staticmethod
     def ip_is_local(ip_string):
         if not ip_string:
@@ -147,7 +175,6 @@ class Stat(object):
 
         connection.send_response(status_code)
         connection.send_header('Content-type', mimetype[f_ext])
-        connection.send_header('Connection', 'close')
         try:
            h = connection.headers.get('Accept-Encoding').split(',')[0]
            compress_method = { 'zlib': zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS),
@@ -208,6 +235,14 @@ class Stat(object):
         statusJSON['connection_info'] = {
             'max_clients': self.AceConfig.maxconns,
             'total_clients': len(clients),
+            'max_broadcasts': self.AceConfig.maxconcurrentchannels,
+            'total_broadcasts': self.AceProxy.clientcounter.getBroadcastCount(),
+            'pinned_broadcasts': self.AceProxy.clientcounter.getPinnedCount(),
+            'admission_queue': len(self.AceProxy.admission),
+            'max_admission_queue': self.AceConfig.admissionqueue,
+            'engines': [{'engine': repr(e), 'healthy': e.healthy, 'weight': e.weight,
+                         'broadcasts': len([b for b in self.AceProxy.clientcounter.broadcasts.values() if b.engine is e])}
+                        for e in self.AceProxy.clientcounter.engines],
             }
 
         def _add_client_data(c):
@@ -229,7 +264,7 @@ class Stat(object):
                 'channelName': c.channelName,
                 'clientIP': c.clientip,
                 'clientInfo': c.clientDetail,
-                #'clientBuff': c.q.qsize()*100/self.AceConfig.videotimeout,
+                'clientLag': round(c.cursor.lag, 1),
                 'startTime': time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(c.connectionTime)),
                 'durationTime': time.strftime('%H:%M:%S', time.gmtime(time.time()-c.connectionTime)),
                 'stat': c.ace.GetSTATUS(),
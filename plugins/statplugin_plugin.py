@@ -555,7 +555,6 @@ class Statplugin(object):
             self.logger.debug('[Statplugin]: Sending START for peer check')
 
             # Send START command manually (we don't need the URL, just STATUS)
-            ace._response['START'] = gevent.event.AsyncResult()
             ace._write(aceclient.acemessages.AceRequest.START(start_params))
 
             # Collect STATUS messages for peer info
@@ -633,7 +632,6 @@ class Statplugin(object):
             connection.send_response(200)
             connection.send_header('Content-Type', 'application/json; charset=utf-8')
             connection.send_header('Content-Length', len(content))
-            connection.send_header('Connection', 'close')
             connection.end_headers()
             connection.wfile.write(content)
         except Exception as e:
@@ -649,7 +647,6 @@ class Statplugin(object):
             connection.send_response(200)
             connection.send_header('Content-Type', 'text/html; charset=utf-8')
             connection.send_header('Content-Length', len(content))
-            connection.send_header('Connection', 'close')
             connection.end_headers()
             connection.wfile.write(content)
         except Exception as e:
@@ -0,0 +1,10 @@
+'''
+Test setup: gevent monkey patching and import paths for acehttp and its modules
+'''
+from gevent import monkey; monkey.patch_all()
+import os, sys, glob
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'modules'))
+for wheel in glob.glob(os.path.join(ROOT_DIR, 'modules', 'wheels', '*.whl')): sys.path.insert(0, wheel)
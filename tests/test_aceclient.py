@@ -0,0 +1,30 @@
+import gevent
+from gevent.server import StreamServer
+from urllib3.packages.six.moves.urllib.parse import quote
+from requests.compat import json
+
+from aceclient.aceclient import AceClient
+
+def reversed_engine(requests=2):
+    '''Engine API port which answers concurrent LOADASYNC requests in the reverse order'''
+    def handle(sock, address):
+        f = sock.makefile('rb')
+        ids = [f.readline().split()[1].decode() for _ in range(requests)]
+        for requestid in reversed(ids):
+           sock.sendall(('LOADRESP %s %s\r\n' % (requestid, quote(json.dumps({'status': 1, 'infohash': requestid * 40})))).encode())
+        gevent.sleep(10)
+    server = StreamServer(('127.0.0.1', 0), handle)
+    server.start()
+    return server
+
+def test_loadresp_goes_to_request_with_same_id():
+    server = reversed_engine()
+    params = {'ace': {'aceHostIP': '127.0.0.1', 'aceAPIport': server.server_port}, 'result_timeout': 2}
+    try:
+       client = AceClient(params)
+       lookups = [gevent.spawn(client.GetLOADASYNC, {'infohash': x, 'developer_id': 0, 'affiliate_id': 0, 'zone_id': 0})
+                  for x in ('first', 'second')]
+       gevent.joinall(lookups, timeout=3, raise_error=True)
+       assert [x.value['infohash'] for x in lookups] == ['1' * 40, '2' * 40]
+       assert not client._loadresp
+    finally: server.stop()
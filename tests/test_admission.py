@@ -0,0 +1,45 @@
+import gevent
+
+from aceclient.admission import AdmissionController
+
+class Slots(object):
+    '''Broadcast manager stand-in: number of free client slots'''
+    def __init__(self, free):
+        self.free = free
+
+    def available(self, clients, broadcasts):
+        return self.free - clients > 0
+
+def test_waiters_are_served_by_priority_when_slot_frees():
+    admission, slots = AdmissionController(queuesize=5, perip=2, wait=5), Slots(1)
+    first = admission.admit('10.0.0.1', AdmissionController.RUNNING, 0, slots.available)
+    assert first == [1, 0] and admission.pending == [1, 0]
+    served = []
+    def wait(clientip, priority):
+        ticket = admission.admit(clientip, priority, 0, slots.available)
+        served.append(clientip)
+        admission.done(ticket)
+    waiters = [gevent.spawn(wait, '10.0.0.2', AdmissionController.NEW),
+               gevent.spawn(wait, '10.0.0.3', AdmissionController.PINNED)]
+    gevent.sleep(0.1)
+    assert len(admission) == 2 and not served
+    admission.done(first)  # Slot is free again
+    gevent.joinall(waiters, timeout=3)
+    assert served == ['10.0.0.3', '10.0.0.2']
+    assert admission.pending == [0, 0] and not len(admission)
+
+def test_queue_and_per_ip_limits():
+    admission, slots = AdmissionController(queuesize=2, perip=1, wait=5), Slots(0)
+    waiters = [gevent.spawn(admission.admit, x, AdmissionController.RUNNING, 0, slots.available) for x in ('10.0.0.1', '10.0.0.2')]
+    gevent.sleep(0.1)
+    assert admission.admit('10.0.0.3', AdmissionController.PINNED, 0, slots.available) is None  # Queue is full
+    gevent.killall(waiters)
+    waiter = gevent.spawn(admission.admit, '10.0.0.1', AdmissionController.RUNNING, 0, slots.available)
+    gevent.sleep(0.1)
+    assert admission.admit('10.0.0.1', AdmissionController.RUNNING, 0, slots.available) is None  # One waiting request per IP
+    waiter.kill()
+
+def test_request_gives_up_after_wait():
+    admission = AdmissionController(wait=0.2)
+    assert admission.admit('10.0.0.1', AdmissionController.NEW, 0, lambda clients, broadcasts: False) is None
+    assert not len(admission) and admission.pending == [0, 0]
@@ -0,0 +1,70 @@
+import gevent
+
+from aceclient.aceclient import AceException
+from aceclient.clientcounter import ClientCounter
+
+INFOHASH = 'a' * 40
+
+class FakeAceClient(object):
+    def StopBroadcast(self): pass
+    def ShutdownAce(self): pass
+
+class FakeEngine(object):
+    '''Engine of EnginePool: sessions for new broadcasts'''
+    def __init__(self, delay=0, error=None):
+        self.clients = 0
+        self.delay, self.error = delay, error
+
+    def client(self):
+        self.clients += 1
+        gevent.sleep(self.delay)  # AUTH of a new session
+        if self.error: raise self.error
+        return FakeAceClient()
+
+    def release(self, client): pass
+
+class FakeEngines(list):
+    def candidates(self, broadcasts): return iter(self)
+
+class Client(object):
+    infohash = INFOHASH
+
+def manager(**kwargs):
+    engine = FakeEngine(**kwargs)
+    return ClientCounter(FakeEngines([engine])), engine
+
+def test_dead_pinned_broadcast_is_not_reused():
+    clientcounter, engine = manager()
+    broadcast = clientcounter.getOrCreateBroadcast(INFOHASH, {})
+    broadcast.pinned = 'content_id:x'
+    broadcast.buffer.close()  # Engine stream died
+    client = Client()
+    clientcounter.addClient(client)
+    assert client.broadcast is not broadcast
+    assert not client.broadcast.buffer.closed
+    assert engine.clients == 2
+
+def test_client_of_replaced_broadcast_leaves_new_one_running():
+    clientcounter, engine = manager()
+    old = Client()
+    clientcounter.addClient(old)
+    old.broadcast.buffer.close()
+    new = Client()
+    clientcounter.addClient(new)
+    clientcounter.deleteClient(old)
+    assert clientcounter.broadcasts[INFOHASH] is new.broadcast
+    assert new.broadcast.clients == set([new])
+
+def test_concurrent_requests_share_one_broadcast():
+    clientcounter, engine = manager(delay=0.1)
+    requests = [gevent.spawn(clientcounter.getOrCreateBroadcast, INFOHASH, {}) for _ in range(3)]
+    gevent.joinall(requests, timeout=3, raise_error=True)
+    assert requests[0].value is requests[1].value is requests[2].value
+    assert engine.clients == 1 and not clientcounter.creating
+
+def test_concurrent_requests_share_creation_error():
+    clientcounter, engine = manager(delay=0.1, error=AceException('No engine'))
+    requests = [gevent.spawn(clientcounter.getOrCreateBroadcast, INFOHASH, {}) for _ in range(3)]
+    gevent.joinall(requests, timeout=3)
+    assert all(isinstance(x.exception, AceException) for x in requests)
+    assert engine.clients == 1 and INFOHASH not in clientcounter.broadcasts
@@ -0,0 +1,40 @@
+import pytest
+from gevent import socket
+
+from aceclient.aceclient import AceException
+from aceclient.enginepool import Engine, EnginePool
+
+class FakeAceClient(object):
+    def __init__(self, speed):
+        self.speed = speed
+
+    def GetSTATUS(self):
+        return {'status': 'dl', 'speed_down': self.speed}
+
+class FakeBroadcast(object):
+    def __init__(self, engine, speed=0):
+        self.engine, self.aceClient = engine, FakeAceClient(speed)
+
+def engine(port=62062, weight=1):
+    return Engine({'ace': {'aceHostIP': '127.0.0.1', 'aceAPIport': port, 'aceHTTPport': port}, 'connect_timeout': 1}, weight)
+
+def test_engines_sorted_by_load_per_weight():
+    small, big, spare = engine(weight=1), engine(weight=2), engine(weight=1)
+    pool = EnginePool([small, big, spare])
+    broadcasts = [FakeBroadcast(small, 100), FakeBroadcast(big, 50), FakeBroadcast(big, 50)]
+    assert pool.candidates(broadcasts) == [spare, big, small]  # Equal broadcasts per weight - less download speed first
+    spare.healthy = False
+    assert pool.select(broadcasts) is big
+    small.healthy = big.healthy = False
+    assert pool.candidates(broadcasts) == [spare, big, small]  # No healthy engine - try them all
+
+def test_unavailable_engine_is_marked_unhealthy():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()  # Nothing listens on this port
+    dead, alive = engine(port), engine()
+    pool = EnginePool([dead, alive])
+    with pytest.raises(AceException): dead.client()
+    assert not dead.healthy
+    assert pool.candidates([]) == [alive]
@@ -0,0 +1,58 @@
+import time
+
+import gevent
+from gevent import socket
+from gevent.server import StreamServer
+from gevent.pywsgi import WSGIServer
+import pytest
+
+from aceclient.enginestream import EngineStream, HLSStream
+
+PACKET = b'\x47' + b'\x00' * 187
+
+def serve(body, stall=True):
+    '''Engine HTTP stream sending body, then keeping the connection open without data'''
+    def handle(sock, address):
+        sock.recv(4096)
+        sock.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: video/mp2t\r\n\r\n' + body)
+        if stall: gevent.sleep(10)
+    server = StreamServer(('127.0.0.1', 0), handle)
+    server.start()
+    return server
+
+def test_chunks_are_aligned_to_ts_packets():
+    server = serve(b'\x00' * 5 + PACKET * 10 + PACKET[:100], stall=False)
+    try:
+       chunks = list(EngineStream('http://127.0.0.1:%d/content' % server.server_port, timeout=2, flushsize=188 * 4, flushtime=0.1))
+    finally: server.stop()
+    assert b''.join(chunks)[:188 * 10] == PACKET * 10  # Garbage before the first packet is skipped
+    assert all(len(x) % 188 == 0 for x in chunks[:-1])
+
+def test_stall_with_partial_packet_is_detected():
+    server = serve(PACKET * 2 + PACKET[:100])
+    try:
+       chunks = iter(EngineStream('http://127.0.0.1:%d/content' % server.server_port, timeout=1, flushtime=0.1))
+       with gevent.Timeout(5):
+          assert next(chunks) == PACKET * 2
+          started = time.time()
+          with pytest.raises(socket.timeout): next(chunks)
+       assert time.time() - started < 2
+    finally: server.stop()
+
+def test_hls_segments_are_deduplicated_by_media_sequence():
+    windows = iter([(0, 3, ''), (1, 3, ''), (2, 3, '#EXT-X-ENDLIST\n')])  # Sliding playlist window: first seq, length, tail
+    def app(environ, start_response):
+        if environ['PATH_INFO'].endswith('.m3u8'):
+           first, length, tail = next(windows)
+           body = '#EXTM3U\n#EXT-X-TARGETDURATION:1\n#EXT-X-MEDIA-SEQUENCE:%d\n' % first
+           body += ''.join('#EXTINF:1.0,\n%d.ts\n' % x for x in range(first, first + length)) + tail
+        else: body = 'segment%s;' % environ['PATH_INFO'][1:-3]
+        start_response('200 OK', [('Content-Length', str(len(body)))])
+        return [body.encode()]
+    server = WSGIServer(('127.0.0.1', 0), app, log=None)
+    server.start()
+    try:
+       with gevent.Timeout(10):
+          data = b''.join(HLSStream('http://127.0.0.1:%d/index.m3u8' % server.server_port, timeout=2))
+    finally: server.stop()
+    assert data == b''.join(b'segment%d;' % x for x in range(5))
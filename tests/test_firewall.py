@@ -0,0 +1,21 @@
+import doctest
+import random
+
+import firewall
+from firewall import NetworkMatcher, IPNetwork, IPAddress
+
+def test_doctest():
+    assert doctest.testmod(firewall).failed == 0
+
+def test_matches_linear_check():
+    random.seed(1)
+    netranges = [u'%d.%d.0.0/%d' % (random.randint(1, 223), random.randint(0, 255), random.choice((16, 20, 24))) for _ in range(200)]
+    netranges += [u'127.0.0.1', u'2001:db8::/32']
+    matcher = NetworkMatcher(netranges)
+    clients = [u'%d.%d.%d.%d' % (random.randint(1, 223), random.randint(0, 255), random.randint(0, 255), random.randint(1, 254)) for _ in range(300)]
+    clients += [x.split('/')[0].replace('.0.0', '.0.9') for x in netranges[:50]]
+    clients += [u'127.0.0.1', u'2001:db8::1', u'2001:db9::1', u'::ffff:127.0.0.1']
+    for ip in clients:
+       address = IPAddress(ip)
+       address = getattr(address, 'ipv4_mapped', None) or address
+       assert (ip in matcher) == any(address in IPNetwork(x) for x in netranges if IPNetwork(x).version == address.version), ip
@@ -0,0 +1,79 @@
+import gevent
+from gevent.server import StreamServer
+from gevent import socket
+import pytest
+
+import acehttp
+
+class PingPlugin(object):
+    def handle(self, connection):
+        connection.send_response(200)
+        connection.send_header('Content-Length', 4)
+        connection.end_headers()
+        connection.wfile.write(b'pong')
+
+class HeadersPlugin(object):
+    def handle(self, connection):
+        # Playlist plugins index headers like HTTPMessage: missing header is None
+        body = ('%s %s %s' % (connection.headers['host'], connection.headers['Referer'], 'range' in connection.headers)).encode()
+        connection.send_response(200)
+        connection.send_header('Content-Length', len(body))
+        connection.end_headers()
+        connection.wfile.write(body)
+
+def redirect(self):
+    # Redirect without Connection: close - connection must be closed by the handler anyway
+    self.send_response(302)
+    self.send_header('Location', '/hls/%s/index.m3u8' % self.infohash)
+    self.send_header('Content-Length', 0)
+    self.end_headers()
+
+@pytest.fixture
+def server(monkeypatch):
+    AceProxy, AceConfig = acehttp.AceProxy, acehttp.AceConfig
+    monkeypatch.setattr(AceConfig, 'hlsoutput', True)
+    monkeypatch.setattr(AceConfig, 'httpkeepalivetimeout', 2)
+    monkeypatch.setattr(AceConfig, 'firewall', False)
+    monkeypatch.setattr(AceProxy, 'pluginshandlers', {'ping': PingPlugin(), 'headers': HeadersPlugin()}, raising=False)
+    monkeypatch.setattr(AceProxy, 'clientcounter', acehttp.ClientCounter(), raising=False)
+    monkeypatch.setattr(AceProxy, 'pinned', set(), raising=False)
+    monkeypatch.setattr(acehttp, 'getContentInfo', lambda params: {'infohash': 'a' * 40, 'files': [('channel.ts', 0)]})
+    monkeypatch.setattr(acehttp.HTTPHandler, 'redirectHLS', redirect)
+    acehttp.buildAdmission()
+    acehttp.buildRoutes()
+    server = StreamServer(('127.0.0.1', 0), handle=acehttp.HTTPHandler)
+    server.start()
+    yield server
+    server.stop()
+
+def exchange(server, data):
+    s = socket.create_connection(('127.0.0.1', server.server_port))
+    s.sendall(data)
+    response = b''
+    with gevent.Timeout(5):
+       while True:
+          chunk = s.recv(65536)
+          if not chunk: break
+          response += chunk
+    s.close()
+    return response
+
+def test_pipelined_plugin_requests_keep_connection(server):
+    s = socket.create_connection(('127.0.0.1', server.server_port))
+    s.sendall(b'GET /ping HTTP/1.1\r\nHost: x\r\n\r\nGET /ping HTTP/1.1\r\nHost: x\r\n\r\n')
+    response = b''
+    with gevent.Timeout(5):
+       while response.count(b'pong') < 2: response += s.recv(65536)
+    assert response.count(b'HTTP/1.1 200') == 2
+    assert b'Connection: close' not in response
+    s.close()
+
+def test_pipelined_request_after_redirect_is_not_served(server):
+    response = exchange(server, b'GET /content_id/x/stream.m3u8 HTTP/1.1\r\nHost: x\r\n\r\n'
+                                b'GET /ping HTTP/1.1\r\nHost: x\r\n\r\n')
+    assert response.startswith(b'HTTP/1.1 302')
+    assert response.count(b'HTTP/1.1') == 1
+
+def test_missing_header_is_none(server):
+    response = exchange(server, b'GET /headers HTTP/1.1\r\nHOST: proxy:8888\r\nConnection: close\r\n\r\n')
+    assert response.endswith(b'proxy:8888 None False')
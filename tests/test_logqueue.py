@@ -0,0 +1,30 @@
+import logging
+
+import logqueue
+from logqueue import RateLimitFilter
+
+def record(msg, *args):
+    return logging.LogRecord('HTTPServer', logging.INFO, __file__, 1, msg, args, None)
+
+def test_distinct_access_lines_are_not_suppressed():
+    ratelimit = RateLimitFilter(burst=20, interval=60)
+    records = [record('[%s]: %s %s request for: %s', '10.0.0.1', 'GET', 'HTTP/1.1', '/content_id/%d/stream.ts' % i) for i in range(30)]
+    assert all(ratelimit.filter(x) for x in records)
+
+def test_identical_lines_are_limited():
+    ratelimit = RateLimitFilter(burst=20, interval=60)
+    passed = [ratelimit.filter(record('<<< %s', 'STATUS main:err')) for _ in range(30)]
+    assert passed.count(True) == 20
+    later = record('<<< %s', 'STATUS main:err')
+    later.created += 60
+    assert ratelimit.filter(later)
+    assert '[10 identical messages suppressed]' in later.getMessage()
+
+def test_rate_limit_runs_in_background_thread(tmp_path):
+    handler = logqueue.setup(logging.INFO, str(tmp_path / 'log'), queuesize=100, burst=20, interval=60)
+    try:
+       assert isinstance(handler, logqueue.QueueHandler) and not handler.filters
+       assert any(isinstance(x, RateLimitFilter) for x in handler.handlers[0].filters)
+    finally:
+       logging.getLogger().removeHandler(handler)
+       handler.close()
@@ -0,0 +1,35 @@
+from aceclient.mpegts import TSScanner
+from aceclient.ringbuffer import RingBuffer
+
+def packet(pid, payload=b'', start=True, adaptation=b''):
+    '''TS packet: adaptation field (if any) and payload padded with stuffing bytes'''
+    flags = 0x30 if adaptation else 0x10
+    header = bytearray([0x47, (0x40 if start else 0) | pid >> 8, pid & 0xFF, flags])
+    if adaptation: header += bytearray([len(adaptation)]) + adaptation
+    return bytes(header + payload + b'\xff' * (188 - len(header) - len(payload)))
+
+# PAT: program 1 -> PMT PID 0x1000
+PAT = packet(0, b'\x00\x00\xb0\x0d\x00\x01\xc1\x00\x00\x00\x01\xf0\x00' + b'\x00' * 4)
+# PMT: PCR PID 0x100, H.264 video on 0x100, AAC audio on 0x101
+PMT = packet(0x1000, b'\x00\x02\xb0\x17\x00\x01\xc1\x00\x00\xe1\x00\xf0\x00\x1b\xe1\x00\xf0\x00\x0f\xe1\x01\xf0\x00' + b'\x00' * 4)
+KEYFRAME = packet(0x100, adaptation=b'\x40' + b'\x00' * 6)
+FRAME = packet(0x100)
+AUDIO = packet(0x101)
+
+def test_keyframes_found_across_chunk_boundaries():
+    stream = PAT + PMT + FRAME + KEYFRAME + AUDIO + FRAME + KEYFRAME
+    scanner = TSScanner()
+    for pos in range(0, len(stream), 100): scanner.scan(stream[pos:pos + 100], pos)
+    assert scanner.video_pid == 0x100 and scanner.pids == (0x100, 0x101)
+    assert scanner.keyframes == [188 * 3, 188 * 6]
+    assert scanner.psi == PAT + PMT
+
+def test_late_joiner_starts_from_last_keyframe_with_psi():
+    ring = RingBuffer(maxlag=0, faststart=True)
+    ring.put(PAT + PMT + KEYFRAME + FRAME)
+    ring.put(AUDIO + KEYFRAME + FRAME)
+    ring.put(AUDIO)
+    reader = ring.reader()
+    assert next(reader) == PAT + PMT
+    assert next(reader) == KEYFRAME + FRAME
+    assert next(reader) == AUDIO
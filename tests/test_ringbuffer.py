@@ -0,0 +1,12 @@
+import pytest
+
+from aceclient.ringbuffer import RingBuffer, SlowClientError
+
+def test_disconnect_reports_lag_of_dropped_data():
+    ring = RingBuffer(maxsize=188 * 40, maxlag=0, policy='disconnect', faststart=False)
+    ring.put(b'\x47' * 188 * 10)
+    reader = ring.reader()
+    for _ in range(20): ring.put(b'\x47' * 188 * 10)  # Reader's data leaves the buffer
+    with pytest.raises(SlowClientError) as error:
+       next(reader)
+    assert '(20 chunks, 37600 bytes)' in str(error.value)
@@ -0,0 +1,25 @@
+import gevent
+from gevent.server import StreamServer
+
+from aceclient.aceclient import AceClient
+from aceclient.sessionpool import SessionPool
+
+def silent_engine():
+    '''Engine API port which accepts connections and never answers (hung engine)'''
+    server = StreamServer(('127.0.0.1', 0), lambda sock, address: gevent.sleep(10))
+    server.start()
+    return server
+
+def test_checked_out_session_is_reaped_on_timeout():
+    server = silent_engine()
+    params = {'ace': {'aceHostIP': '127.0.0.1', 'aceAPIport': server.server_port}, 'videotimeout': 0.3, 'result_timeout': 0.1}
+    try:
+       pool = SessionPool(params, size=1)
+       pool.put(AceClient(params))
+       gevent.sleep(0.8)
+       pool.size = 0  # No refill
+       session = pool.get()  # Idle pooled session survives read timeouts
+       assert session and not session.pooled
+       gevent.sleep(0.8)
+       assert not session  # Hung session of a broadcast is closed
+    finally: server.stop()
@@ -0,0 +1,10 @@
+import acehttp
+
+def test_broadcast_keeps_no_request_handler_state():
+    request = dict(acehttp.aceParams(), content_id='abc', infohash='a' * 40, file_indexes='0', developer_id='0',
+                   affiliate_id='0', zone_id='0', stream_id='0', connection=object(), rfile=object(), wfile=object(),
+                   headers={}, clientip='10.0.0.1', channelName='Channel')
+    params = acehttp.broadcastParams(request)
+    assert not set(['connection', 'rfile', 'wfile', 'headers', 'clientip', 'channelName']) & set(params)
+    assert params['content_id'] == 'abc' and params['file_indexes'] == '0' and 'stream_type' in params
+    assert params['videobuffersize'] == request['videobuffersize']
@@ -0,0 +1,38 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Firewall netranges matcher microbenchmark: linear IPNetwork check vs NetworkMatcher
+
+Usage: python tools/firewall_benchmark.py [ranges] [lookups]
+'''
+import os, sys, glob, random, timeit
+# The same module path as acehttp.py: custom modules and bundled wheels
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'modules'))
+for wheel in glob.glob(os.path.join(ROOT_DIR, 'modules', 'wheels', '*.whl')): sys.path.insert(0, wheel)
+
+from firewall import NetworkMatcher, IPNetwork, IPAddress
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+random.seed(1)
+netranges = [u'%d.%d.%d.0/24' % (random.randint(1, 223), random.randint(0, 255), random.randint(0, 255)) for _ in range(count)]
+netranges += [u'2001:db8:%x::/48' % random.randint(0, 0xffff) for _ in range(count // 10)]
+clients = [u'%d.%d.%d.%d' % (random.randint(1, 223), random.randint(0, 255), random.randint(0, 255), random.randint(1, 254))
+           for _ in range(lookups)]
+clients[::2] = [x.rsplit('.', 2)[0] + '.0.1' for x in netranges[:lookups:2]][:len(clients[::2])]
+
+linear = lambda ip: any([IPAddress(ip) in IPNetwork(i) for i in netranges])
+sample = clients[:max(lookups // 100, 10)]
+t = timeit.timeit(lambda: [linear(ip) for ip in sample], number=1) / len(sample)
+print('%d ranges, %d lookups' % (len(netranges), lookups))
+print('linear IPNetwork parse per request: %10.2f us/lookup' % (t * 1e6))
+t = timeit.timeit(lambda: NetworkMatcher(netranges), number=1)
+print('compile:                            %10.2f ms' % (t * 1e3))
+matcher = NetworkMatcher(netranges, cachesize=0)
+assert all(linear(ip) == (ip in matcher) for ip in sample)
+t = timeit.timeit(lambda: [ip in matcher for ip in clients], number=5) / (5 * lookups)
+print('binary search:                      %10.2f us/lookup' % (t * 1e6))
+matcher = NetworkMatcher(netranges)
+t = timeit.timeit(lambda: [ip in matcher for ip in clients[:100]], number=50) / (50 * 100)
+print('binary search with LRU hits:        %10.2f us/lookup' % (t * 1e6))